@@ -0,0 +1,91 @@
+"""
+Batch nearest-station queries with NumPy.
+
+get_nearest_stations answers many nearest-station queries at once by
+computing haversine terms for a block of query points against every station
+with array broadcasting, instead of calling get_lat_lon_distance once per
+query and station from Python.
+"""
+
+import numpy as np
+
+from bike_share import LAT_INDEX, LON_INDEX, STATION_ID_INDEX
+
+# The largest number of (query, station) pairs held in memory at once.
+DEFAULT_MAX_PAIRS = 1 << 22
+
+
+# Class: StationCoordinates
+class StationCoordinates:
+    """
+    Columnar station coordinates, ready for broadcasting.
+
+    The columns are stored in reverse list order so that argmin, which picks
+    the first of several equal values, picks the station that appears last
+    in the list, matching the tie-break rule of get_nearest_station.
+
+    Attributes:
+    ids (np.ndarray): Station IDs.
+    lats (np.ndarray): Station latitudes, in radians.
+    lons (np.ndarray): Station longitudes, in radians.
+    cos_lats (np.ndarray): Cosines of the station latitudes.
+    """
+
+    def __init__(self, stations) -> None:
+        """
+        Build the coordinate columns from the given station rows.
+
+        Args:
+        stations (list or StationIndex): A list of lists representing multiple stations.
+        """
+        rows = list(stations)[::-1]
+        self.ids = np.array([row[STATION_ID_INDEX] for row in rows], dtype=np.int64)
+        self.lats = np.radians(np.array([row[LAT_INDEX] for row in rows], dtype=np.float64))
+        self.lons = np.radians(np.array([row[LON_INDEX] for row in rows], dtype=np.float64))
+        self.cos_lats = np.cos(self.lats)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+# Function: get_nearest_stations
+def get_nearest_stations(lats, lons, stations,
+                         max_pairs: int = DEFAULT_MAX_PAIRS) -> np.ndarray:
+    """
+    Returns the station IDs of the nearest station to each of the given
+    coordinates. In case of a tie, the station that appears last in the list
+    is chosen, as in get_nearest_station. If there are no stations, every
+    result is -1.
+
+    Queries are processed in chunks so that at most max_pairs haversine
+    terms are held in memory at a time. Only the haversine term under the
+    square root is compared, since the distance increases with it.
+
+    Args:
+    lats (array-like): Latitudes of the query points.
+    lons (array-like): Longitudes of the query points.
+    stations (list, StationIndex or StationCoordinates): The stations to search.
+    max_pairs (int): The largest number of (query, station) pairs per chunk.
+
+    Returns:
+    np.ndarray: The nearest station ID for each query point.
+    """
+    if not isinstance(stations, StationCoordinates):
+        stations = StationCoordinates(stations)
+
+    query_lats = np.radians(np.asarray(lats, dtype=np.float64)).ravel()
+    query_lons = np.radians(np.asarray(lons, dtype=np.float64)).ravel()
+    nearest = np.full(len(query_lats), -1, dtype=np.int64)
+    if len(stations) == 0:
+        return nearest
+
+    chunk_size = max(1, max_pairs // len(stations))
+    for start in range(0, len(query_lats), chunk_size):
+        chunk_lats = query_lats[start:start + chunk_size, np.newaxis]
+        chunk_lons = query_lons[start:start + chunk_size, np.newaxis]
+        a = np.sin((stations.lats - chunk_lats) / 2) ** 2
+        a += (np.cos(chunk_lats) * stations.cos_lats
+              * np.sin((stations.lons - chunk_lons) / 2) ** 2)
+        nearest[start:start + chunk_size] = stations.ids[np.argmin(a, axis=1)]
+
+    return nearest
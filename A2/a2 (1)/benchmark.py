@@ -0,0 +1,320 @@
+"""
+Benchmarks of the bike_share operations at production sizes.
+
+Station networks of 1,000 to 1,000,000 stations are synthesised from the
+stations.csv distribution: every synthetic station copies the capacity,
+name and flags of a randomly chosen real station, and its position is the
+real station's position spread out from the centre of the network, so the
+station density stays close to that of the real network. Each operation is
+timed as a bike_share function over a plain list of stations and over the
+indexed and batch alternatives, with the same seeded queries for every
+variant. Nearest-station queries are scattered around randomly chosen
+stations, as riders are.
+
+For each variant the benchmark reports the number of calls made, the
+throughput in items per second, latency percentiles per call, and the peak
+memory allocated while building the variant's structures and running one
+call, on top of the shared station list. Results are printed and can be
+written to a JSON file to compare runs.
+
+NumPy is optional; without it the batch nearest-station variant is skipped.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from math import sqrt
+
+from bike_share import (CAPACITY_INDEX, IS_RENTING_INDEX, IS_RETURNING_INDEX,
+                        LAT_INDEX, LON_INDEX, NAME_INDEX, StationIndex,
+                        convert_data, get_nearest_station, get_station_info,
+                        rent_bike, return_bike, upgrade_stations)
+from capacity_index import CapacityStationIndex
+from spatial_index import StationGrid
+from station_loader import STATION_SCHEMA, iter_stations, load_stations
+from station_table import StationTable
+
+try:
+    import numpy
+    from batch_nearest import StationCoordinates, get_nearest_stations
+except ImportError:
+    numpy = None
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+DEFAULT_QUERIES = 1000
+DEFAULT_REPEATS = 3  # Calls of whole-network operations
+DEFAULT_MAX_SECONDS = 2.0  # Time allowed for the calls of one variant
+BATCH_SIZE = 64  # Query points per batch nearest-station call
+QUERY_SPREAD = 0.005  # Spread of query points around stations, in degrees
+PERCENTILES = (50, 90, 99)
+STATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stations.csv')
+HEADER = [column for column, _ in STATION_SCHEMA]
+
+
+# Function: synthesize_lines
+def synthesize_lines(template: list, size: int, seed: int = 0) -> list:
+    """
+    Returns the lines of a stations.csv file describing size synthetic
+    stations drawn from the distribution of the template stations.
+
+    Args:
+    template (list): A list of lists representing the real stations.
+    size (int): The number of stations to synthesise.
+    seed (int): The seed for the random generator.
+
+    Returns:
+    list: The header line followed by one line per station.
+    """
+    rng = random.Random(seed)
+    center_lat = sum(station[LAT_INDEX] for station in template) / len(template)
+    center_lon = sum(station[LON_INDEX] for station in template) / len(template)
+    scale = sqrt(size / len(template))
+    jitter = 0.002 * scale  # About the spacing of neighbouring stations
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(HEADER)
+    for station_id in range(size):
+        station = rng.choice(template)
+        capacity = station[CAPACITY_INDEX]
+        bikes = rng.randint(0, capacity)
+        lat = center_lat + (station[LAT_INDEX] - center_lat) * scale + rng.gauss(0, jitter)
+        lon = center_lon + (station[LON_INDEX] - center_lon) * scale + rng.gauss(0, jitter)
+        writer.writerow([station_id, station[NAME_INDEX], capacity, bikes, capacity - bikes,
+                         f'{lat:.6f}', f'{lon:.6f}', str(station[IS_RENTING_INDEX]).upper(),
+                         str(station[IS_RETURNING_INDEX]).upper()])
+    return output.getvalue().splitlines()
+
+
+# Function: percentile
+def percentile(values: list, percent: float) -> float:
+    """
+    Returns the nearest-rank percentile of a sorted list of values.
+
+    Args:
+    values (list): The values, in increasing order.
+    percent (float): The percentile, from 0 to 100.
+
+    Returns:
+    float: The value at that percentile.
+    """
+    rank = max(1, round(percent / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+# Function: run_variant
+def run_variant(source, setup, operation, arguments, max_seconds: float,
+                items_per_call: int = 1) -> dict:
+    """
+    Measure one variant of an operation.
+
+    source returns a fresh copy of the input, and setup builds the state the
+    operation works on, such as an index, from that copy. arguments is a
+    list of callables, each of which returns the argument of one call. The
+    copies and arguments are made before the timer starts and outside the
+    memory measurement. Calls stop early once max_seconds have been spent.
+
+    Args:
+    source (callable): Returns a fresh copy of the input.
+    setup (callable): Builds the variant's state from the input.
+    operation (callable): Called as operation(state, argument).
+    arguments (list): Callables returning the argument of each call.
+    max_seconds (float): The time allowed for the calls.
+    items_per_call (int): The number of items, such as queries, each call handles.
+
+    Returns:
+    dict: The number of calls, total seconds, throughput in items per
+    second, latency percentiles in microseconds, and peak memory in bytes.
+    """
+    initial, argument = source(), arguments[0]()
+    tracemalloc.start()
+    operation(setup(initial), argument)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del initial
+
+    state = setup(source())
+    latencies = []
+    deadline = time.perf_counter() + max_seconds
+    for prepare in arguments:
+        argument = prepare()
+        began = time.perf_counter_ns()
+        operation(state, argument)
+        latencies.append(time.perf_counter_ns() - began)
+        if time.perf_counter() > deadline:
+            break
+
+    seconds = sum(latencies) / 1e9
+    latencies.sort()
+    result = {'calls': len(latencies), 'seconds': seconds,
+              'throughput': len(latencies) * items_per_call / seconds if seconds else 0.0}
+    for percent in PERCENTILES:
+        result[f'p{percent}_us'] = percentile(latencies, percent) / 1000
+    result['max_us'] = latencies[-1] / 1000
+    result['peak_bytes'] = peak
+    return result
+
+
+def _constant(value):
+    return lambda: value
+
+
+# Function: benchmark_size
+def benchmark_size(template: list, size: int, queries: int = DEFAULT_QUERIES,
+                   repeats: int = DEFAULT_REPEATS,
+                   max_seconds: float = DEFAULT_MAX_SECONDS, seed: int = 0) -> list:
+    """
+    Benchmark every operation and variant on a synthetic network.
+
+    Args:
+    template (list): A list of lists representing the real stations.
+    size (int): The number of stations in the network.
+    queries (int): The number of calls of each per-station operation.
+    repeats (int): The number of calls of each whole-network operation.
+    max_seconds (float): The time allowed for the calls of each variant.
+    seed (int): The seed for the network and the queries.
+
+    Returns:
+    list: One dict per variant, with its size, operation and variant name
+    added to the results of run_variant.
+    """
+    lines = synthesize_lines(template, size, seed)
+    stations = list(iter_stations(lines))
+    rng = random.Random(seed + 1)
+    ids = [rng.randrange(size) for _ in range(queries)]
+    points = []
+    for _ in range(queries):
+        near = stations[rng.randrange(size)]
+        points.append((near[LAT_INDEX] + rng.gauss(0, QUERY_SPREAD),
+                       near[LON_INDEX] + rng.gauss(0, QUERY_SPREAD)))
+    threshold = sorted(station[CAPACITY_INDEX] for station in stations)[size // 2]
+    id_arguments = [_constant(station_id) for station_id in ids]
+    point_arguments = [_constant(point) for point in points]
+
+    def copy():
+        return [list(station) for station in stations]
+
+    def station_list(rows):
+        return rows
+
+    def nothing(*_):
+        return None
+
+    csv_rows = list(csv.reader(lines))[1:]
+    variants = [
+        ('convert_data', 'convert_data', nothing, nothing,
+         lambda state, rows: convert_data(rows),
+         [lambda: [list(row) for row in csv_rows]] * repeats, size),
+        ('convert_data', 'iter_stations', nothing, nothing,
+         lambda state, _: list(iter_stations(lines)), [nothing] * repeats, size),
+    ]
+    for name, setup in (('list', station_list), ('StationIndex', StationIndex),
+                        ('StationTable', StationTable)):
+        variants.append(('get_station_info', name, copy, setup,
+                         lambda state, station_id: get_station_info(station_id, state),
+                         id_arguments, 1))
+    variants.append(('get_nearest_station', 'list', copy, station_list,
+                     lambda state, point: get_nearest_station(point[0], point[1], state),
+                     point_arguments, 1))
+    variants.append(('get_nearest_station', 'StationGrid', copy, StationGrid,
+                     lambda state, point: state.nearest(point[0], point[1]),
+                     point_arguments, 1))
+    if numpy is not None:
+        batches = [_constant((numpy.array([lat for lat, _ in points[start:start + BATCH_SIZE]]),
+                              numpy.array([lon for _, lon in points[start:start + BATCH_SIZE]])))
+                   for start in range(0, queries, BATCH_SIZE)]
+        variants.append(('get_nearest_station', 'get_nearest_stations', copy,
+                         StationCoordinates,
+                         lambda state, batch: get_nearest_stations(batch[0], batch[1], state),
+                         batches, BATCH_SIZE))
+    for operation in (rent_bike, return_bike):
+        for name, setup in (('list', station_list), ('StationIndex', StationIndex),
+                            ('StationTable', StationTable)):
+            variants.append((operation.__name__, name, copy, setup,
+                             lambda state, station_id, operation=operation:
+                             operation(station_id, state), id_arguments, 1))
+    for name, setup in (('list', station_list), ('CapacityStationIndex', CapacityStationIndex),
+                        ('StationTable', StationTable)):
+        variants.append(('upgrade_stations', name, copy, setup,
+                         lambda state, _: upgrade_stations(threshold, 1, state),
+                         [nothing] * repeats, size))
+
+    results = []
+    for operation, variant, source, setup, call, arguments, items in variants:
+        result = run_variant(source, setup, call, arguments, max_seconds, items)
+        results.append({'size': size, 'operation': operation, 'variant': variant, **result})
+    return results
+
+
+# Function: run_benchmarks
+def run_benchmarks(sizes: list = DEFAULT_SIZES, queries: int = DEFAULT_QUERIES,
+                   repeats: int = DEFAULT_REPEATS,
+                   max_seconds: float = DEFAULT_MAX_SECONDS, seed: int = 0,
+                   stations_path: str = STATIONS_PATH, report=None) -> dict:
+    """
+    Benchmark every size in turn.
+
+    Args:
+    sizes (list): The network sizes to benchmark.
+    queries (int): The number of calls of each per-station operation.
+    repeats (int): The number of calls of each whole-network operation.
+    max_seconds (float): The time allowed for the calls of each variant.
+    seed (int): The seed for the networks and queries.
+    stations_path (str): The stations file whose distribution is sampled.
+    report (callable): Called with each variant's result as it finishes, or None.
+
+    Returns:
+    dict: {'environment': details of the run, 'results': the results of
+    every variant}.
+    """
+    template = list(load_stations(stations_path))
+    environment = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'numpy': numpy.__version__ if numpy is not None else None,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'sizes': list(sizes), 'queries': queries, 'repeats': repeats,
+        'max_seconds': max_seconds, 'seed': seed,
+    }
+    results = []
+    for size in sizes:
+        for result in benchmark_size(template, size, queries, repeats, max_seconds, seed):
+            results.append(result)
+            if report is not None:
+                report(result)
+    return {'environment': environment, 'results': results}
+
+
+def _print_result(result: dict) -> None:
+    print(f"{result['size']:>8} {result['operation']:<20} {result['variant']:<22}"
+          f"{result['calls']:>6} {result['throughput']:>14,.0f}/s"
+          f"{result['p50_us']:>12.1f} {result['p99_us']:>12.1f}"
+          f"{result['peak_bytes'] / 1e6:>10.1f}", flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES)
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--max-seconds', type=float, default=DEFAULT_MAX_SECONDS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stations', default=STATIONS_PATH,
+                        help='station file whose distribution is sampled')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'operation':<20} {'variant':<22}{'calls':>6} {'throughput':>16}"
+          f"{'p50 us':>12} {'p99 us':>12}{'peak MB':>10}")
+    benchmarks = run_benchmarks(args.sizes, args.queries, args.repeats, args.max_seconds,
+                                args.seed, args.stations, _print_result)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(benchmarks, output, indent=2)
@@ -1,24 +1,33 @@
 from math import radians, cos, sin, sqrt, atan2
 
 # Constants to make the code easier to maintain
+# (column positions follow the column order of stations.csv)
 STATION_ID_INDEX = 0
 NAME_INDEX = 1
-LAT_INDEX = 2
-LON_INDEX = 3
 CAPACITY_INDEX = 2
-NUM_BIKES_AVAILABLE_INDEX = 5
-NUM_DOCKS_AVAILABLE_INDEX = 6
+NUM_BIKES_AVAILABLE_INDEX = 3
+NUM_DOCKS_AVAILABLE_INDEX = 4
+LAT_INDEX = 5
+LON_INDEX = 6
+IS_RENTING_INDEX = 7
+IS_RETURNING_INDEX = 8
 # Constants for station data
 ID = 0
 NAME = 1
-LATITUDE = 2
-LONGITUDE = 3
-CAPACITY = 4
-BIKES_AVAILABLE = 5
-DOCKS_AVAILABLE = 6
+CAPACITY = 2
+BIKES_AVAILABLE = 3
+DOCKS_AVAILABLE = 4
+LATITUDE = 5
+LONGITUDE = 6
 
 
 NO_KIOSK = 'SMART'
+# Operations in a rental log, for apply_transactions
+RENT = 'rent'
+RETURN = 'return'
+EARTH_RADIUS = 6371  # Radius of the Earth in kilometers
+# String values of the is_renting and is_returning columns
+FLAG_STRINGS = {'TRUE': True, 'FALSE': False}
 
 # Helper function to check if a string represents a number
 def is_number(s: str) -> bool:
@@ -51,20 +60,348 @@ def convert_data(data: list[list[str]]) -> None:
                 else:
                     row[i] = num
 
+# Class: StationListener
+class StationListener:
+    """
+    A base class for StationIndex listeners. Each method does nothing, so a
+    listener only overrides the changes it needs to follow.
+    """
+
+    def station_added(self, station: list) -> None:
+        pass
+
+    def station_removed(self, station: list) -> None:
+        pass
+
+    def station_adjusted(self, station: list, index: int, delta: int) -> None:
+        pass
+
+    def stations_adjusted(self, stations: list, index: int, delta: int) -> None:
+        for station in stations:
+            self.station_adjusted(station, index, delta)
+
+# Class: StationIndex
+class StationIndex:
+    """
+    An index over a list of stations that maps each station ID to its row.
+    
+    The index is built once from the converted station rows and shares the
+    list it was built from, so changes made through rent_bike, return_bike,
+    upgrade_stations, add and remove are seen through both, and the list
+    can still be passed to the functions that take a list of stations. If a
+    station ID appears more than once, the first row with that ID is
+    indexed, which matches what a linear scan of the list would find.
+    
+    Each row keeps the slot it had when it was indexed. Removing a station
+    records its slot, so that the position of any other row can be worked
+    out from its slot without scanning the list; the slots are renumbered
+    once the removed ones outnumber the rows.
+    
+    Listeners can be attached to keep derived structures up to date. A
+    listener is an object with station_added(station), station_removed(station)
+    and station_adjusted(station, index, delta) methods, which the index calls
+    after each add, remove and adjust, usually a StationListener subclass.
+    Containers that change many stations by the same amount at once, such as
+    CapacityStationIndex, call stations_adjusted(stations, index, delta)
+    instead, which StationListener passes on to station_adjusted.
+    
+    Attributes:
+    rows (list): The station rows, in their original order.
+    by_id (dict): A mapping from station ID to station row.
+    listeners (list): The attached listeners.
+    """
+
+    def __init__(self, stations: list) -> None:
+        """
+        Build the index from the given station rows. Any other iterable of
+        rows, such as a generator, is first copied into a new list.
+        
+        Args:
+        stations (list): A list of lists representing multiple stations.
+        """
+        if not isinstance(stations, list):
+            stations = list(stations)
+        self.rows = stations
+        self.by_id = {}
+        self.listeners = []
+        self._slots = {}  # Station ID -> slot of the indexed row
+        self._duplicates = {}  # Station ID -> [slot, row] of later rows
+        self._gaps = []  # Slots of removed rows, in increasing order
+        self._index_rows()
+
+    def _index_rows(self) -> None:
+        self.by_id.clear()
+        self._slots.clear()
+        self._duplicates.clear()
+        self._gaps.clear()
+        for slot, station in enumerate(self.rows):
+            self._index_row(station, slot)
+
+    def _index_row(self, station: list, slot: int) -> None:
+        station_id = station[STATION_ID_INDEX]
+        if station_id in self.by_id:
+            self._duplicates.setdefault(station_id, []).append([slot, station])
+        else:
+            self.by_id[station_id] = station
+            self._slots[station_id] = slot
+
+    def _gaps_before(self, slot: int) -> int:
+        low, high = 0, len(self._gaps)
+        while low < high:
+            middle = (low + high) // 2
+            if self._gaps[middle] < slot:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _unindex(self, station_id: int) -> int:
+        """
+        Stop indexing the row of the station with the given ID, indexing
+        the next row with the same ID in its place, and return the row's
+        slot. The row itself is left in rows.
+        """
+        slot = self._slots.pop(station_id)
+        del self.by_id[station_id]
+        later = self._duplicates.get(station_id)
+        if later:
+            self._slots[station_id], self.by_id[station_id] = later.pop(0)
+            if not later:
+                del self._duplicates[station_id]
+        return slot
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def find(self, station_id: int) -> list:
+        """
+        Returns the row of the station with the given ID, or None if there is
+        no such station.
+        
+        Args:
+        station_id (int): The station ID to search for.
+        
+        Returns:
+        list: The station row, or None.
+        """
+        return self.by_id.get(station_id)
+
+    def add(self, station: list) -> None:
+        """
+        Add a new station row to the end of the index.
+        
+        Args:
+        station (list): A list representing a station.
+        """
+        self.rows.append(station)
+        self._index_row(station, len(self.rows) + len(self._gaps) - 1)
+        for listener in self.listeners:
+            listener.station_added(station)
+
+    def remove(self, station_id: int) -> list:
+        """
+        Remove the station with the given ID and return its row, or None if
+        there is no such station. If other rows have the same ID, the next
+        one in list order is indexed in its place.
+        
+        Args:
+        station_id (int): The station ID to remove.
+        
+        Returns:
+        list: The removed station row, or None.
+        """
+        station = self.by_id.get(station_id)
+        if station is None:
+            return None
+        slot = self._unindex(station_id)
+        gaps = self._gaps_before(slot)
+        del self.rows[slot - gaps]
+        self._gaps.insert(gaps, slot)
+        if len(self._gaps) > len(self.rows):
+            self._index_rows()
+        for listener in self.listeners:
+            listener.station_removed(station)
+        return station
+
+    def remove_many(self, station_ids: list) -> list:
+        """
+        Remove the stations with the given IDs, as remove does for each of
+        them in turn, in one pass over rows. IDs with no station are
+        skipped.
+        
+        Args:
+        station_ids (list): The station IDs to remove.
+        
+        Returns:
+        list: The removed station rows, in the order they were removed.
+        """
+        removed = []
+        positions = set()
+        for station_id in station_ids:
+            station = self.by_id.get(station_id)
+            if station is not None:
+                slot = self._unindex(station_id)
+                positions.add(slot - self._gaps_before(slot))
+                removed.append(station)
+        if removed:
+            self.rows[:] = [row for position, row in enumerate(self.rows)
+                            if position not in positions]
+            self._index_rows()
+        for station in removed:
+            for listener in self.listeners:
+                listener.station_removed(station)
+        return removed
+
+    def adjust(self, station: list, index: int, delta: int) -> None:
+        """
+        Add delta to the value at the given index of a station row in the
+        index, and tell the listeners about the change.
+        
+        Args:
+        station (list): A station row in the index.
+        index (int): The index of the value to change.
+        delta (int): The amount to add.
+        """
+        station[index] += delta
+        for listener in self.listeners:
+            listener.station_adjusted(station, index, delta)
+
+    def add_listener(self, listener) -> None:
+        """
+        Attach a listener, which is told about every later change.
+        
+        Args:
+        listener: An object with station_added, station_removed and station_adjusted methods.
+        """
+        self.listeners.append(listener)
+
+# Helper function to find a station row by its ID
+def _find_station(station_id: int, stations) -> list:
+    """
+    Returns the row of the station with the given ID, or None if there is no
+    such station. Station containers that provide their own find method,
+    such as StationIndex, are asked directly; plain lists of lists are
+    scanned.
+    
+    Args:
+    station_id (int): The station ID to search for.
+    stations (list or StationIndex): The stations to search.
+    
+    Returns:
+    list: The station row, or None.
+    """
+    if hasattr(stations, 'find'):
+        return stations.find(station_id)
+    for station in stations:
+        if station[STATION_ID_INDEX] == station_id:
+            return station
+    return None
+
+# Function: adjust_station
+def adjust_station(stations, station: list, index: int, delta: int) -> None:
+    """
+    Add delta to the value at the given index of a station row. Station
+    containers that provide an adjust method, such as StationIndex, make the
+    change themselves so that they can keep derived data up to date.
+    
+    Args:
+    stations (list or StationIndex): The stations the row belongs to.
+    station (list): A list representing a station.
+    index (int): The index of the value to change.
+    delta (int): The amount to add.
+    """
+    if hasattr(stations, 'adjust'):
+        stations.adjust(station, index, delta)
+    else:
+        station[index] += delta
+
 # Function: has_kiosk
 def has_kiosk(station: list) -> bool:
     """
     Returns True if the station has a kiosk. A station without a kiosk contains
-    the string referred to by NO_KIOSK in its name.
+    the string referred to by NO_KIOSK in its name. Station rows that provide
+    their own has_kiosk method, such as StationTable rows, answer from a
+    precomputed flag.
     
     Args:
-    station (list): A list representing a station with the structure [station_id, name, lat, lon, capacity, num_bikes_available, num_docks_available]
+    station (list): A list representing a station with the structure [station_id, name, capacity, num_bikes_available, num_docks_available, lat, lon]
     
     Returns:
     bool: True if the station has a kiosk, False otherwise.
     """
+    if hasattr(station, 'has_kiosk'):
+        return station.has_kiosk()
     return NO_KIOSK not in station[NAME_INDEX]
 
+# Function: parse_flag
+def parse_flag(value) -> bool:
+    """
+    Returns the truth value of an is_renting or is_returning field. Rows read
+    with station_loader hold bools, while convert_data leaves the strings
+    'TRUE' and 'FALSE' as they are; both are accepted, in any letter case.
+    
+    Args:
+    value (bool or str): The field value.
+    
+    Returns:
+    bool: The flag.
+    
+    Raises:
+    ValueError: If value is a string other than 'TRUE' or 'FALSE'.
+    """
+    if isinstance(value, str):
+        flag = FLAG_STRINGS.get(value.upper())
+        if flag is None:
+            raise ValueError(f'invalid flag value {value!r}')
+        return flag
+    return bool(value)
+
+# Function: station_flag
+def station_flag(station: list, index: int) -> bool:
+    """
+    Returns the is_renting or is_returning flag of a station row. Rows
+    without the field are treated as having it set.
+    
+    Args:
+    station (list): A list representing a station.
+    index (int): IS_RENTING_INDEX or IS_RETURNING_INDEX.
+    
+    Returns:
+    bool: The flag.
+    """
+    return len(station) <= index or parse_flag(station[index])
+
+# Function: can_rent
+def can_rent(station: list) -> bool:
+    """
+    Returns True if a bike can be rented from the station: it has at least
+    one bike available and is renting (see station_flag).
+    
+    Args:
+    station (list): A list representing a station.
+    
+    Returns:
+    bool: True if the station can serve a rental, False otherwise.
+    """
+    return station[NUM_BIKES_AVAILABLE_INDEX] > 0 and station_flag(station, IS_RENTING_INDEX)
+
+# Function: can_return
+def can_return(station: list) -> bool:
+    """
+    Returns True if a bike can be returned to the station: it has at least
+    one dock available and is returning (see station_flag).
+    
+    Args:
+    station (list): A list representing a station.
+    
+    Returns:
+    bool: True if the station can serve a return, False otherwise.
+    """
+    return station[NUM_DOCKS_AVAILABLE_INDEX] > 0 and station_flag(station, IS_RETURNING_INDEX)
+
 # Function: get_station_info
 def get_station_info(station_id: int, stations: list) -> list:
     """
@@ -73,25 +410,27 @@ def get_station_info(station_id: int, stations: list) -> list:
     
     Args:
     station_id (int): The station ID to search for.
-    stations (list): A list of lists representing multiple stations.
+    stations (list or StationIndex): A list of lists representing multiple stations.
     
     Returns:
     list: [station name, number of bikes available, number of docks available, has_kiosk].
     """
-    for station in stations:
-        if station[STATION_ID_INDEX] == station_id:
-            return [
-                station[NAME_INDEX],
-                station[NUM_BIKES_AVAILABLE_INDEX],  # Corrected: Number of bikes available
-                station[NUM_DOCKS_AVAILABLE_INDEX],  # Corrected: Number of docks available
-                has_kiosk(station)
-            ]
+    station = _find_station(station_id, stations)
+    if station is not None:
+        return [
+            station[NAME_INDEX],
+            station[NUM_BIKES_AVAILABLE_INDEX],  # Corrected: Number of bikes available
+            station[NUM_DOCKS_AVAILABLE_INDEX],  # Corrected: Number of docks available
+            has_kiosk(station)
+        ]
 
 
 # Function: get_column_sum
 def get_column_sum(index: int, stations: list) -> int:
     """
     Returns the sum of the values at the given index for all stations in the list.
+    Station containers that provide a column_sum method, such as StationTable,
+    compute the sum themselves.
     
     Args:
     index (int): The index of the column to sum.
@@ -100,12 +439,16 @@ def get_column_sum(index: int, stations: list) -> int:
     Returns:
     int: The sum of the values in the specified column.
     """
+    if hasattr(stations, 'column_sum'):
+        return stations.column_sum(index)
     return sum(station[index] for station in stations)
 
 # Function: get_stations_with_kiosks
 def get_stations_with_kiosks(stations: list) -> list:
     """
     Returns a list of station IDs that have kiosks.
+    Station containers that provide a kiosk_ids method, such as StationTable,
+    compute the list themselves.
     
     Args:
     stations (list): A list of lists representing multiple stations.
@@ -113,6 +456,8 @@ def get_stations_with_kiosks(stations: list) -> list:
     Returns:
     list: A list of station IDs that have kiosks.
     """
+    if hasattr(stations, 'kiosk_ids'):
+        return stations.kiosk_ids()
     return [station[STATION_ID_INDEX] for station in stations if has_kiosk(station)]
 
 # Helper function to calculate distance between two coordinates
@@ -127,7 +472,7 @@ def get_lat_lon_distance(lat1: float, lon1: float, lat2: float, lon2: float) ->
     Returns:
     float: Distance in kilometers.
     """
-    R = 6371.0  # Radius of the Earth in kilometers
+    R = float(EARTH_RADIUS)
     dlat = radians(lat2 - lat1)
     dlon = radians(lon2 - lon1)
     a = (sin(dlat / 2) ** 2 +
@@ -163,45 +508,44 @@ def get_nearest_station(lat: float, lon: float, stations: list) -> int:
 # Function: rent_bike
 def rent_bike(station_id: int, stations: list) -> bool:
     """
-    Rent a bike from a station if at least one bike is available.
+    Rent a bike from a station if at least one bike is available and the
+    station is renting (see can_rent).
     Update the bikes available and docks available counts. 
     
     Args:
     station_id (int): The station ID to rent a bike from.
-    stations (list): A list of lists representing multiple stations.
+    stations (list or StationIndex): A list of lists representing multiple stations.
     
     Returns:
     bool: True if the bike rental is successful, False otherwise.
     """
-    for station in stations:
-        if station[STATION_ID_INDEX] == station_id:
-            if station[NUM_BIKES_AVAILABLE_INDEX] > 0:
-                station[NUM_BIKES_AVAILABLE_INDEX] -= 1
-                station[NUM_DOCKS_AVAILABLE_INDEX] += 1
-                return True
-            else:
-                return False
+    station = _find_station(station_id, stations)
+    if station is not None and can_rent(station):
+        adjust_station(stations, station, NUM_BIKES_AVAILABLE_INDEX, -1)
+        adjust_station(stations, station, NUM_DOCKS_AVAILABLE_INDEX, 1)
+        return True
+    return False
 
 # Function: return_bike
 def return_bike(station_id: int, stations: list) -> bool:
     """
-    Return a bike to a station if at least one dock is available.
+    Return a bike to a station if at least one dock is available and the
+    station is returning (see can_return).
     Update the bikes available and docks available counts. 
     
     Args:
     station_id (int): The station ID to return a bike to.
-    stations (list): A list of lists representing multiple stations.
+    stations (list or StationIndex): A list of lists representing multiple stations.
     
     Returns:
     bool: True if the bike return is successful, False otherwise.
     """
-    for station in stations:
-        if station[STATION_ID_INDEX] == station_id:
-            if station[NUM_DOCKS_AVAILABLE_INDEX] > 0:
-                station[NUM_BIKES_AVAILABLE_INDEX] += 1
-                station[NUM_DOCKS_AVAILABLE_INDEX] -= 1
-                return True
-    return False  # If the station_id is not found
+    station = _find_station(station_id, stations)
+    if station is not None and can_return(station):
+        adjust_station(stations, station, NUM_BIKES_AVAILABLE_INDEX, 1)
+        adjust_station(stations, station, NUM_DOCKS_AVAILABLE_INDEX, -1)
+        return True
+    return False  # If the station_id is not found, has no free docks or is not returning
 
 
 
@@ -209,7 +553,8 @@ def return_bike(station_id: int, stations: list) -> bool:
 def upgrade_stations(capacity_threshold: int, bikes_to_add: int, stations: list) -> int:
     """
     Add bikes and docks to stations with capacity less than the given threshold.
-    Each added bike comes with a new dock.
+    Each added bike comes with a new dock. Station containers that provide an
+    upgrade method, such as StationTable, perform the upgrade themselves.
     
     Args:
     capacity_threshold (int): The capacity below which stations are upgraded.
@@ -219,12 +564,80 @@ def upgrade_stations(capacity_threshold: int, bikes_to_add: int, stations: list)
     Returns:
     int: The total number of bikes added.
     """
+    if hasattr(stations, 'upgrade'):
+        return stations.upgrade(capacity_threshold, bikes_to_add)
+
     total_bikes_added = 0
     
     for station in stations:
         if station[CAPACITY_INDEX] < capacity_threshold:
-            station[NUM_BIKES_AVAILABLE_INDEX] += bikes_to_add
-            station[CAPACITY_INDEX] += bikes_to_add  # Each bike comes with a dock
+            adjust_station(stations, station, NUM_BIKES_AVAILABLE_INDEX, bikes_to_add)
+            adjust_station(stations, station, CAPACITY_INDEX, bikes_to_add)  # Each bike comes with a dock
             total_bikes_added += bikes_to_add
     
-    return total_bikes_added
\ No newline at end of file
+    return total_bikes_added
+
+# Function: apply_transactions
+def apply_transactions(events: list, stations: list) -> tuple:
+    """
+    Apply a log of rentals and returns in one pass, with exactly the results
+    of calling rent_bike or return_bike for each event in order.
+    
+    Events are grouped by station first. Since an event only affects its own
+    station, each station's events are then applied in their original order
+    against local bike and dock counts, and the net change is written back to
+    the station once.
+    
+    Args:
+    events (list): A list of (operation, station_id) pairs, where operation is RENT or RETURN.
+    stations (list or StationIndex): A list of lists representing multiple stations.
+    
+    Returns:
+    tuple: (a list with a success flag for each event, a dict with the number of
+    'rented', 'returned' and 'failed' events).
+    
+    Raises:
+    ValueError: If an event has an unknown operation. No event is applied.
+    """
+    by_station = {}
+    for position, (operation, station_id) in enumerate(events):
+        if operation not in (RENT, RETURN):
+            raise ValueError(f'unknown operation {operation!r} in event {position}')
+        by_station.setdefault(station_id, []).append(position)
+
+    index = stations if hasattr(stations, 'find') else StationIndex(stations)
+
+    results = [False] * len(events)
+    counters = {'rented': 0, 'returned': 0, 'failed': 0}
+    for station_id, positions in by_station.items():
+        station = index.find(station_id)
+        if station is None:
+            counters['failed'] += len(positions)
+            continue
+        bikes = station[NUM_BIKES_AVAILABLE_INDEX]
+        docks = station[NUM_DOCKS_AVAILABLE_INDEX]
+        renting = station_flag(station, IS_RENTING_INDEX)
+        returning = station_flag(station, IS_RETURNING_INDEX)
+        for position in positions:
+            if events[position][0] == RENT:
+                if renting and bikes > 0:
+                    bikes -= 1
+                    docks += 1
+                    results[position] = True
+                    counters['rented'] += 1
+                else:
+                    counters['failed'] += 1
+            elif returning and docks > 0:
+                bikes += 1
+                docks -= 1
+                results[position] = True
+                counters['returned'] += 1
+            else:
+                counters['failed'] += 1
+        if bikes != station[NUM_BIKES_AVAILABLE_INDEX]:
+            adjust_station(index, station, NUM_BIKES_AVAILABLE_INDEX,
+                           bikes - station[NUM_BIKES_AVAILABLE_INDEX])
+            adjust_station(index, station, NUM_DOCKS_AVAILABLE_INDEX,
+                           docks - station[NUM_DOCKS_AVAILABLE_INDEX])
+
+    return results, counters
\ No newline at end of file
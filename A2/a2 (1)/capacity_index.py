@@ -0,0 +1,198 @@
+"""
+A capacity-ordered index of stations for upgrade_stations.
+
+CapacityIndex groups stations into buckets by capacity and keeps the
+distinct capacities in a sorted list, so the stations below a capacity
+threshold are found with one bisect and a walk over the matching buckets,
+in O(log n + k) time for k matching stations, instead of a scan of every
+station. Since stations with the same capacity are upgraded alike, an
+upgrade moves whole buckets to their new capacity rather than moving each
+station on its own.
+"""
+
+from bisect import bisect_left, insort
+
+from bike_share import (CAPACITY_INDEX, NUM_BIKES_AVAILABLE_INDEX,
+                        StationIndex, StationListener)
+
+
+# Class: CapacityIndex
+class CapacityIndex(StationListener):
+    """
+    Stations bucketed by capacity, maintained as a StationIndex listener so
+    that it stays consistent as upgrades change capacities.
+
+    Attributes:
+    buckets (dict): A mapping from capacity to a dict of the station rows
+        with that capacity, keyed by the id() of each row, since a
+        StationIndex can hold several rows with one station ID.
+    capacities (list): The capacities that have buckets, in increasing order.
+    """
+
+    def __init__(self, index: StationIndex) -> None:
+        """
+        Bucket the stations in index and attach to it.
+
+        Args:
+        index (StationIndex): The stations to index.
+        """
+        self.buckets = {}
+        self.capacities = []
+        for station in index:
+            self.station_added(station)
+        index.add_listener(self)
+
+    def _insert(self, station: list, capacity: int) -> None:
+        bucket = self.buckets.get(capacity)
+        if bucket is None:
+            bucket = self.buckets[capacity] = {}
+            insort(self.capacities, capacity)
+        bucket[id(station)] = station
+
+    def _delete(self, station: list, capacity: int) -> None:
+        bucket = self.buckets[capacity]
+        del bucket[id(station)]
+        if not bucket:
+            del self.buckets[capacity]
+            del self.capacities[bisect_left(self.capacities, capacity)]
+
+    def station_added(self, station: list) -> None:
+        self._insert(station, station[CAPACITY_INDEX])
+
+    def station_removed(self, station: list) -> None:
+        self._delete(station, station[CAPACITY_INDEX])
+
+    def station_adjusted(self, station: list, index: int, delta: int) -> None:
+        if index == CAPACITY_INDEX and delta != 0:
+            self._delete(station, station[CAPACITY_INDEX] - delta)
+            self._insert(station, station[CAPACITY_INDEX])
+
+    def shift(self, upgrades) -> list:
+        """
+        Move the buckets as a sequence of upgrades moves their stations,
+        without changing the station rows: each upgrade adds bikes_to_add to
+        every capacity less than its capacity_threshold. Buckets that end up
+        with the same capacity are merged.
+
+        Args:
+        upgrades (list): (capacity_threshold, bikes_to_add) pairs, applied
+            in order.
+
+        Returns:
+        list: A (stations, added) pair for each bucket whose capacity
+        changed: its station rows and the amount added to their capacity.
+        """
+        final = {capacity: capacity for capacity in self.capacities}
+        for capacity_threshold, bikes_to_add in upgrades:
+            for capacity, current in final.items():
+                if current < capacity_threshold:
+                    final[capacity] = current + bikes_to_add
+
+        moved = []
+        buckets = {}
+        for capacity, current in final.items():
+            bucket = self.buckets[capacity]
+            if current != capacity:
+                moved.append((list(bucket.values()), current - capacity))
+            target = buckets.get(current)
+            if target is None:
+                buckets[current] = bucket
+            elif len(target) >= len(bucket):
+                target.update(bucket)
+            else:
+                bucket.update(target)
+                buckets[current] = bucket
+        self.buckets = buckets
+        self.capacities = sorted(buckets)
+        return moved
+
+    def below(self, capacity_threshold: int) -> list:
+        """
+        Returns the stations with capacity less than capacity_threshold, in
+        increasing order of capacity.
+
+        Args:
+        capacity_threshold (int): The capacity to compare against.
+
+        Returns:
+        list: The matching station rows.
+        """
+        found = []
+        for capacity in self.capacities[:bisect_left(self.capacities, capacity_threshold)]:
+            found.extend(self.buckets[capacity].values())
+        return found
+
+    def count_below(self, capacity_threshold: int) -> int:
+        """
+        Returns the number of stations with capacity less than
+        capacity_threshold, without listing them.
+
+        Args:
+        capacity_threshold (int): The capacity to compare against.
+
+        Returns:
+        int: The number of matching stations.
+        """
+        return sum(len(self.buckets[capacity]) for capacity
+                   in self.capacities[:bisect_left(self.capacities, capacity_threshold)])
+
+
+# Class: CapacityStationIndex
+class CapacityStationIndex(StationIndex):
+    """
+    A StationIndex with a CapacityIndex, so upgrade_stations only visits the
+    stations that qualify for an upgrade.
+
+    Attributes:
+    capacity (CapacityIndex): The maintained capacity index.
+    """
+
+    def __init__(self, stations: list) -> None:
+        """
+        Build the index and its capacity index from the given station rows.
+
+        Args:
+        stations (list): A list of lists representing multiple stations.
+        """
+        super().__init__(stations)
+        self.capacity = CapacityIndex(self)
+
+    def upgrade(self, capacity_threshold: int, bikes_to_add: int) -> int:
+        """
+        Add bikes_to_add bikes, each with a new dock, to every station with
+        capacity less than capacity_threshold.
+
+        Args:
+        capacity_threshold (int): The capacity below which stations are upgraded.
+        bikes_to_add (int): The number of bikes (and docks) to add to each qualifying station.
+
+        Returns:
+        int: The total number of bikes added.
+        """
+        return self.upgrade_many([(capacity_threshold, bikes_to_add)])
+
+    def upgrade_many(self, upgrades: list) -> int:
+        """
+        Apply a sequence of upgrades in order, each as upgrade does. The
+        capacity buckets are moved for the whole sequence first, and then
+        each station row is changed once, by its total, with one
+        stations_adjusted call per bucket and column to the other listeners.
+
+        Args:
+        upgrades (list): A list of (capacity_threshold, bikes_to_add) pairs.
+
+        Returns:
+        int: The total number of bikes added.
+        """
+        listeners = [listener for listener in self.listeners
+                     if listener is not self.capacity]
+        total_bikes_added = 0
+        for stations, added in self.capacity.shift(upgrades):
+            for station in stations:
+                station[NUM_BIKES_AVAILABLE_INDEX] += added
+                station[CAPACITY_INDEX] += added
+            for listener in listeners:
+                listener.stations_adjusted(stations, NUM_BIKES_AVAILABLE_INDEX, added)
+                listener.stations_adjusted(stations, CAPACITY_INDEX, added)
+            total_bikes_added += added * len(stations)
+        return total_bikes_added
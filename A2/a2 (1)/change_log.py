@@ -0,0 +1,205 @@
+"""
+A change log of station mutations.
+
+ChangeLog is a StationIndex listener that turns every change made through
+the index into a numbered event: a station added or removed, or a delta
+added to one field of a station, as rent_bike, return_bike and
+upgrade_stations do through adjust_station. Events are kept in a ring buffer
+for consumers to drain in batches, and can also be appended to a file of
+struct-packed records, from which replay rebuilds the stations from an
+earlier copy of them. Changes made directly to a plain list of stations are
+not seen.
+
+Each event is a (sequence number, station ID, field, value) tuple. For an
+adjustment, field is the row index that changed and value the delta. For an
+added station, field is STATION_ADDED and value the station row; for a
+removed station, field is STATION_REMOVED and value is None.
+"""
+
+import json
+import os
+import struct
+from collections import deque
+
+from bike_share import STATION_ID_INDEX, StationIndex, StationListener, adjust_station
+
+DEFAULT_CAPACITY = 65536  # Events kept in the ring buffer
+STATION_ADDED = -1
+STATION_REMOVED = -2
+
+# sequence number, station ID, field, delta; an added station's record is
+# followed by a length-prefixed JSON encoding of its row.
+_RECORD = struct.Struct('<Qqbq')
+_LENGTH = struct.Struct('<I')
+
+
+def _read_events(log_file):
+    """
+    Yield the events read from an open change log file, stopping at the end
+    of the file or at an event cut short there. When an event is yielded,
+    the file position is just past it.
+    """
+    while True:
+        record = log_file.read(_RECORD.size)
+        if len(record) < _RECORD.size:
+            return
+        sequence, station_id, field, delta = _RECORD.unpack(record)
+        if field == STATION_ADDED:
+            prefix = log_file.read(_LENGTH.size)
+            if len(prefix) < _LENGTH.size:
+                return
+            length, = _LENGTH.unpack(prefix)
+            row = log_file.read(length)
+            if len(row) < length:
+                return
+            yield sequence, station_id, field, json.loads(row)
+        elif field == STATION_REMOVED:
+            yield sequence, station_id, field, None
+        else:
+            yield sequence, station_id, field, delta
+
+
+# Function: read_log
+def read_log(path: str):
+    """
+    Yield the events in a change log file, oldest first. An event cut short
+    at the end of the file, as a crash in the middle of a write leaves it,
+    is ignored.
+
+    Args:
+    path (str): The log file.
+
+    Yields:
+    tuple: A (sequence number, station ID, field, value) event.
+    """
+    with open(path, 'rb') as log_file:
+        yield from _read_events(log_file)
+
+
+# Class: ChangeLog
+class ChangeLog(StationListener):
+    """
+    A log of the changes made through a StationIndex.
+
+    Attributes:
+    events (deque): The events not yet drained, oldest first.
+    next_sequence (int): The sequence number of the next event.
+    dropped (int): The number of events pushed out of a full ring buffer
+        before being drained. A consumer that sees it grow has missed
+        changes and should reread the stations.
+    path (str): The file events are appended to, or None.
+    """
+
+    def __init__(self, index: StationIndex = None, capacity: int = DEFAULT_CAPACITY,
+                 path: str = None) -> None:
+        """
+        Start a log, attached to index if one is given. If path names an
+        existing log file, new events are appended to it and numbered after
+        its last event, and an event cut short at its end is dropped first.
+
+        Args:
+        index (StationIndex): The stations to log changes of, or None to attach later.
+        capacity (int): The number of events the ring buffer holds.
+        path (str): The file to append events to, or None to keep them in memory only.
+        """
+        self.events = deque(maxlen=capacity)
+        self.next_sequence = 0
+        self.dropped = 0
+        self.path = path
+        self._file = None
+        if path is not None:
+            if os.path.exists(path):
+                with open(path, 'r+b') as log_file:
+                    end = 0
+                    for sequence, _, _, _ in _read_events(log_file):
+                        self.next_sequence = sequence + 1
+                        end = log_file.tell()
+                    log_file.truncate(end)
+            self._file = open(path, 'ab')
+        if index is not None:
+            index.add_listener(self)
+
+    def _append(self, station_id: int, field: int, value) -> None:
+        event = (self.next_sequence, station_id, field, value)
+        self.next_sequence += 1
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append(event)
+        if self._file is not None:
+            if field == STATION_ADDED:
+                row = json.dumps(list(value)).encode()
+                self._file.write(_RECORD.pack(event[0], station_id, field, 0)
+                                 + _LENGTH.pack(len(row)) + row)
+            else:
+                self._file.write(_RECORD.pack(event[0], station_id, field, value or 0))
+
+    def station_added(self, station: list) -> None:
+        self._append(station[STATION_ID_INDEX], STATION_ADDED, list(station))
+
+    def station_removed(self, station: list) -> None:
+        self._append(station[STATION_ID_INDEX], STATION_REMOVED, None)
+
+    def station_adjusted(self, station: list, index: int, delta: int) -> None:
+        self._append(station[STATION_ID_INDEX], index, delta)
+
+    def drain(self, max_events: int = None) -> list:
+        """
+        Remove and return the oldest events from the ring buffer.
+
+        Args:
+        max_events (int): The largest number of events to return, or None for all.
+
+        Returns:
+        list: The events, oldest first.
+        """
+        if max_events is None or max_events >= len(self.events):
+            drained = list(self.events)
+            self.events.clear()
+            return drained
+        return [self.events.popleft() for _ in range(max_events)]
+
+    def flush(self) -> None:
+        """
+        Write any buffered events to the log file.
+        """
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        """
+        Flush and close the log file, if there is one.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Function: replay
+def replay(events, stations) -> int:
+    """
+    Apply logged events, oldest first, to a copy of the stations taken
+    before the first of them. Adjustments of stations that are not found are
+    skipped.
+
+    Args:
+    events (iterable): (sequence number, station ID, field, value) events,
+        such as those from ChangeLog.drain or read_log.
+    stations (StationIndex): The stations to change.
+
+    Returns:
+    int: The number of events applied.
+    """
+    applied = 0
+    for _, station_id, field, value in events:
+        if field == STATION_ADDED:
+            stations.add(list(value))
+        elif field == STATION_REMOVED:
+            if stations.remove(station_id) is None:
+                continue
+        else:
+            station = stations.find(station_id)
+            if station is None:
+                continue
+            adjust_station(stations, station, field, value)
+        applied += 1
+    return applied
@@ -0,0 +1,259 @@
+"""
+Cached station-to-station distances.
+
+DistanceMatrix keeps a float32 n-by-n matrix of get_lat_lon_distance values,
+filled one row at a time as rows are first used. The matrix lives in an
+anonymous memory map, or in a file when a path is given, so a computed
+matrix can be reused by later processes. NeighbourDistances is the
+bounded-memory alternative: it keeps only the distances from each station to
+its k nearest stations and computes any other distance when asked.
+
+Both caches are invalidated when the set of stations changes. When they are
+built from a StationIndex they listen for stations being added or removed;
+otherwise, call refresh after changing the station list.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+from array import array
+
+from bike_share import (LAT_INDEX, LON_INDEX, STATION_ID_INDEX, StationListener,
+                        get_lat_lon_distance)
+from spatial_index import StationGrid
+
+DEFAULT_NEIGHBOURS = 16
+
+# magic, number of stations, fingerprint of the station set
+_HEADER = struct.Struct('<4sQ20s')
+_MAGIC = b'BSDM'
+
+
+# Function: station_fingerprint
+def station_fingerprint(stations) -> bytes:
+    """
+    Returns a digest of the IDs and coordinates of the given stations, in
+    order, which changes whenever the set of stations does.
+
+    Args:
+    stations (list or StationIndex): A list of lists representing multiple stations.
+
+    Returns:
+    bytes: A 20-byte digest.
+    """
+    digest = hashlib.sha1()
+    for station in stations:
+        digest.update(struct.pack('<qdd', station[STATION_ID_INDEX],
+                                  station[LAT_INDEX], station[LON_INDEX]))
+    return digest.digest()
+
+
+# Class: _StationCache
+class _StationCache(StationListener):
+    """
+    The station bookkeeping shared by the distance caches: the stations in
+    cache order, their positions by ID, and invalidation.
+    """
+
+    def __init__(self, stations) -> None:
+        self.stations = stations
+        self.stale = True
+        if hasattr(stations, 'add_listener'):
+            stations.add_listener(self)
+
+    def station_added(self, station: list) -> None:
+        self.stale = True
+
+    def station_removed(self, station: list) -> None:
+        self.stale = True
+
+    def refresh(self) -> None:
+        """
+        Drop every cached distance and start again from the current stations.
+        """
+        self.rows = list(self.stations)
+        self.positions = {}
+        for position, station in enumerate(self.rows):
+            self.positions.setdefault(station[STATION_ID_INDEX], position)
+        self.stale = False
+
+    def _position(self, station_id: int) -> int:
+        if self.stale:
+            self.refresh()
+        return self.positions[station_id]
+
+
+# Class: DistanceMatrix
+class DistanceMatrix(_StationCache):
+    """
+    A lazily filled matrix of distances between stations.
+
+    The file, if any, holds a header with the number of stations and their
+    fingerprint, one byte per row saying whether the row has been computed,
+    and then the float32 matrix. A file made for a different set of stations
+    is started over.
+
+    Attributes:
+    path (str): The file holding the matrix, or None for memory only.
+    """
+
+    def __init__(self, stations, path: str = None) -> None:
+        """
+        Prepare a matrix for the given stations.
+
+        Args:
+        stations (list or StationIndex): A list of lists representing multiple stations.
+        path (str): The file to keep the matrix in, or None to keep it in memory.
+        """
+        self.path = path
+        self._map = None
+        super().__init__(stations)
+
+    def refresh(self) -> None:
+        super().refresh()
+        self.close()
+        n = len(self.rows)
+        fingerprint = station_fingerprint(self.rows)
+        flags_size = n + (-n % 4)
+        size = _HEADER.size + flags_size + 4 * n * n
+
+        if self.path is None:
+            self._map = mmap.mmap(-1, max(size, 1))
+            _HEADER.pack_into(self._map, 0, _MAGIC, n, fingerprint)
+        else:
+            reuse = False
+            if os.path.exists(self.path) and os.path.getsize(self.path) == size:
+                with open(self.path, 'rb') as matrix_file:
+                    reuse = matrix_file.read(_HEADER.size) == _HEADER.pack(_MAGIC, n, fingerprint)
+            with open(self.path, 'r+b' if reuse else 'w+b') as matrix_file:
+                if not reuse:
+                    matrix_file.write(_HEADER.pack(_MAGIC, n, fingerprint))
+                    matrix_file.truncate(size)
+                self._map = mmap.mmap(matrix_file.fileno(), size)
+
+        self._computed = memoryview(self._map)[_HEADER.size:_HEADER.size + n]
+        start = _HEADER.size + flags_size
+        self._matrix = memoryview(self._map)[start:start + 4 * n * n].cast('f')
+
+    def close(self) -> None:
+        """
+        Release the matrix, flushing it to its file if it has one.
+        """
+        if self._map is not None:
+            self._computed.release()
+            self._matrix.release()
+            if self.path is not None:
+                self._map.flush()
+            self._map.close()
+            self._map = None
+
+    def _row(self, position: int) -> int:
+        """
+        Returns the offset of a row in the matrix, computing the row first if
+        it has not been computed yet.
+        """
+        n = len(self.rows)
+        offset = position * n
+        if not self._computed[position]:
+            lat = self.rows[position][LAT_INDEX]
+            lon = self.rows[position][LON_INDEX]
+            self._matrix[offset:offset + n] = array('f', [
+                get_lat_lon_distance(lat, lon, station[LAT_INDEX], station[LON_INDEX])
+                for station in self.rows])
+            self._computed[position] = 1
+        return offset
+
+    def distance(self, id_a: int, id_b: int) -> float:
+        """
+        Returns the distance in kilometers between two stations.
+
+        Args:
+        id_a (int): The ID of the first station.
+        id_b (int): The ID of the second station.
+
+        Returns:
+        float: The distance, to float32 precision.
+
+        Raises:
+        KeyError: If either station is not in the station set.
+        """
+        a = self._position(id_a)
+        b = self._position(id_b)
+        if self._computed[b] and not self._computed[a]:
+            a, b = b, a
+        return self._matrix[self._row(a) + b]
+
+
+# Class: NeighbourDistances
+class NeighbourDistances(_StationCache):
+    """
+    Distances from each station to its k nearest stations, computed for a
+    station the first time it is used. Distances to other stations are
+    computed on every request instead of being stored.
+
+    Attributes:
+    k (int): The number of neighbours kept per station.
+    """
+
+    def __init__(self, stations, k: int = DEFAULT_NEIGHBOURS) -> None:
+        """
+        Prepare the cache for the given stations.
+
+        Args:
+        stations (list or StationIndex): A list of lists representing multiple stations.
+        k (int): The number of neighbours to keep per station.
+        """
+        self.k = k
+        super().__init__(stations)
+
+    def refresh(self) -> None:
+        super().refresh()
+        self._grid = StationGrid(self.rows)
+        self._neighbours = {}
+
+    def neighbours(self, station_id: int) -> dict:
+        """
+        Returns the k nearest stations to a station, other than itself.
+
+        Args:
+        station_id (int): The ID of the station.
+
+        Returns:
+        dict: A mapping from neighbour station ID to distance, nearest first.
+        """
+        position = self._position(station_id)
+        station = self.rows[position]
+        found = self._neighbours.get(station_id)
+        if found is None:
+            lat, lon = station[LAT_INDEX], station[LON_INDEX]
+            found = {}
+            for other_id in self._grid.k_nearest(lat, lon, self.k + 1):
+                if other_id != station_id and len(found) < self.k:
+                    other = self.rows[self.positions[other_id]]
+                    found[other_id] = get_lat_lon_distance(lat, lon, other[LAT_INDEX],
+                                                           other[LON_INDEX])
+            self._neighbours[station_id] = found
+        return found
+
+    def distance(self, id_a: int, id_b: int) -> float:
+        """
+        Returns the distance in kilometers between two stations.
+
+        Args:
+        id_a (int): The ID of the first station.
+        id_b (int): The ID of the second station.
+
+        Returns:
+        float: The distance.
+
+        Raises:
+        KeyError: If either station is not in the station set.
+        """
+        found = self.neighbours(id_a).get(id_b)
+        if found is not None:
+            return found
+        a = self._position(id_a)
+        b = self._position(id_b)
+        a, b = self.rows[a], self.rows[b]
+        return get_lat_lon_distance(a[LAT_INDEX], a[LON_INDEX], b[LAT_INDEX], b[LON_INDEX])
@@ -0,0 +1,150 @@
+"""
+Merge a new station feed snapshot into the stations in memory.
+
+Instead of replacing the whole station list on every refresh, merge_feed
+matches the rows of the new snapshot to the current stations by station ID
+and changes only what differs. Capacity, bike and dock counts are changed
+with adjust_station, so a StationIndex tells its listeners about each delta
+and the row stays where it is. A station whose name, position or
+is_renting/is_returning flags change is replaced: the old row is removed
+and the new one added, so every listener sees the new values. Replaced and
+added stations go to the end of list order.
+"""
+
+from bike_share import (CAPACITY_INDEX, IS_RENTING_INDEX, IS_RETURNING_INDEX,
+                        NUM_BIKES_AVAILABLE_INDEX, NUM_DOCKS_AVAILABLE_INDEX,
+                        STATION_ID_INDEX, StationIndex, adjust_station,
+                        station_flag)
+
+# Fields that are brought up to date in place, by adding the difference.
+COUNT_FIELDS = (CAPACITY_INDEX, NUM_BIKES_AVAILABLE_INDEX, NUM_DOCKS_AVAILABLE_INDEX)
+# Fields compared by their truth value, so that the 'TRUE'/'FALSE' strings
+# left by convert_data match the bools of station_loader rows.
+FLAG_FIELDS = (IS_RENTING_INDEX, IS_RETURNING_INDEX)
+
+
+# Function: changed_fields
+def changed_fields(station: list, row: list) -> list:
+    """
+    Returns the indexes at which a station row and a new feed row differ.
+    If the rows have different lengths, every index is reported. The
+    is_renting and is_returning flags are compared with station_flag.
+
+    Args:
+    station (list): The current station row.
+    row (list): The station's row in the new feed.
+
+    Returns:
+    list: The changed indexes, in increasing order.
+    """
+    if len(station) != len(row):
+        return list(range(max(len(station), len(row))))
+    return [index for index in range(len(row))
+            if (station_flag(station, index) != station_flag(row, index)
+                if index in FLAG_FIELDS else station[index] != row[index])]
+
+
+# Function: apply_changes
+def apply_changes(stations, station: list, row: list, fields: list) -> list:
+    """
+    Bring a station up to date with its new feed row, given the fields that
+    changed. If only counts changed they are adjusted in place; otherwise
+    the station is replaced by a copy of row.
+
+    Args:
+    stations (StationIndex): The stations the row belongs to.
+    station (list): The current station row.
+    row (list): The station's row in the new feed.
+    fields (list): The changed indexes, from changed_fields.
+
+    Returns:
+    list: The station's row after the change, which is station itself
+    unless it was replaced.
+    """
+    if all(index in COUNT_FIELDS for index in fields):
+        for index in fields:
+            adjust_station(stations, station, index, row[index] - station[index])
+        return station
+    stations.remove(station[STATION_ID_INDEX])
+    replacement = list(row)
+    stations.add(replacement)
+    return replacement
+
+
+# Function: diff_feed
+def diff_feed(stations, rows: list) -> dict:
+    """
+    Compare a new feed snapshot with the current stations by station ID,
+    without changing anything.
+
+    Args:
+    stations (list or StationIndex): The current stations.
+    rows (list): The typed station rows of the new snapshot.
+
+    Returns:
+    dict: {'added': the new rows of stations not yet known, 'removed': the
+    IDs of stations missing from the snapshot, 'changed': a mapping from
+    the ID of each station that differs to its changed indexes}.
+    """
+    if not hasattr(stations, 'find'):
+        stations = StationIndex(stations)
+    added = []
+    changed = {}
+    seen = set()
+    for row in rows:
+        station_id = row[STATION_ID_INDEX]
+        seen.add(station_id)
+        station = stations.find(station_id)
+        if station is None:
+            added.append(row)
+        else:
+            fields = changed_fields(station, row)
+            if fields:
+                changed[station_id] = fields
+    removed = dict.fromkeys(station[STATION_ID_INDEX] for station in stations
+                            if station[STATION_ID_INDEX] not in seen)
+    return {'added': added, 'removed': list(removed), 'changed': changed}
+
+
+# Function: merge_feed
+def merge_feed(stations, rows: list) -> dict:
+    """
+    Bring the stations in line with a new feed snapshot, changing only the
+    stations that differ. A plain list of stations is changed through a
+    StationIndex built over it.
+
+    Args:
+    stations (list or StationIndex): The current stations.
+    rows (list): The typed station rows of the new snapshot.
+
+    Returns:
+    dict: The IDs of the 'added', 'removed' and 'changed' stations, as
+    lists in the order they were applied.
+    """
+    index = stations
+    if not hasattr(stations, 'find'):
+        index = StationIndex(stations)
+    summary = {'added': [], 'removed': [], 'changed': []}
+    seen = set()
+    for row in rows:
+        station_id = row[STATION_ID_INDEX]
+        seen.add(station_id)
+        station = index.find(station_id)
+        if station is None:
+            index.add(list(row))
+            summary['added'].append(station_id)
+        else:
+            fields = changed_fields(station, row)
+            if fields:
+                apply_changes(index, station, row, fields)
+                summary['changed'].append(station_id)
+
+    removed = [station[STATION_ID_INDEX] for station in index
+               if station[STATION_ID_INDEX] not in seen]
+    if hasattr(index, 'remove_many'):
+        index.remove_many(removed)
+    else:
+        for station_id in removed:
+            index.remove(station_id)
+    summary['removed'] = removed
+    return summary
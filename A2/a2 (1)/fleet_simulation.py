@@ -0,0 +1,285 @@
+"""
+A multiprocess discrete-event simulation of a bike share fleet.
+
+Stations are partitioned into geographic regions by longitude, and each
+region is simulated by a worker process using the rent_bike and return_bike
+rules on its own stations. Riders appear at random points in a region, rent
+from the nearest station and ride to a random station anywhere in the city.
+Time is kept in whole seconds.
+
+The day is simulated in epochs of exchange_interval seconds. Each region is
+kept for the whole day by one long-lived worker process, together with its
+station index, grid and pending arrivals, so an epoch only sends the worker
+the trips arriving from other regions. Trips that end in another region are
+handed back to the parent, which delivers them to their region at the start
+of the next epoch. No trip is shorter than MIN_TRIP_SECONDS and no epoch is
+longer, so a trip never ends in the epoch it started in, and every arrival
+is simulated at its own time.
+"""
+
+import argparse
+import os
+import random
+import time
+from heapq import heappop, heappush
+from math import ceil
+
+from bike_share import (LAT_INDEX, LON_INDEX, STATION_ID_INDEX, StationIndex,
+                        get_lat_lon_distance, rent_bike, return_bike)
+from spatial_index import StationGrid
+from worker_pool import map_tasks, start_workers, worker_state
+
+SECONDS_PER_DAY = 24 * 60 * 60
+DEFAULT_TRIPS_PER_DAY = 20000
+RIDING_SPEED = 15.0  # Average riding speed, in km/h
+MIN_TRIP_SECONDS = 60
+# Seconds between cross-region exchanges; at most MIN_TRIP_SECONDS.
+DEFAULT_EXCHANGE_INTERVAL = MIN_TRIP_SECONDS
+RETURN_ALTERNATIVES = 5  # Nearby stations tried when a destination is full
+
+
+# Function: partition_stations
+def partition_stations(stations, num_regions: int) -> list:
+    """
+    Returns the stations split into num_regions regions of nearly equal size,
+    ordered from west to east.
+
+    Args:
+    stations (list or StationIndex): A list of lists representing multiple stations.
+    num_regions (int): The number of regions.
+
+    Returns:
+    list: A list of lists of station rows, one per region.
+    """
+    ordered = sorted(stations, key=lambda station: station[LON_INDEX])
+    size = ceil(len(ordered) / num_regions) if ordered else 1
+    return [ordered[start:start + size] for start in range(0, len(ordered), size)]
+
+
+def _trip_seconds(origin: list, destination: tuple) -> int:
+    """
+    Returns the riding time from an origin station row to a directory entry.
+    """
+    distance = get_lat_lon_distance(origin[LAT_INDEX], origin[LON_INDEX],
+                                    destination[2], destination[3])
+    return max(MIN_TRIP_SECONDS, round(distance / RIDING_SPEED * 3600))
+
+
+# Class: _Region
+class _Region:
+    """
+    The simulation state of one region, kept by the worker simulating it.
+    """
+
+    def __init__(self, region: int, stations: list, rate: float, seed: int) -> None:
+        self.region = region
+        self.stations = stations
+        self.index = StationIndex(stations)
+        self.grid = StationGrid(self.index)
+        lats = [station[LAT_INDEX] for station in stations]
+        lons = [station[LON_INDEX] for station in stations]
+        self.bounds = (min(lats), max(lats), min(lons), max(lons))
+        self.rate = rate
+        self.rng = random.Random(seed * 1000003 + region * 7919)
+        self.pending = []
+        self.next_departure = self.rng.expovariate(rate) if rate > 0 else float('inf')
+        self.stats = {'departures': 0, 'failed_rentals': 0, 'arrivals': 0,
+                      'rerouted_returns': 0, 'failed_returns': 0, 'outbound': 0,
+                      'seconds': 0.0}
+
+    def run(self, end: int, directory: list) -> dict:
+        """
+        Simulate the region up to end seconds and return the trips leaving
+        it, as a mapping from region to (arrival time, station ID) pairs.
+        """
+        began = time.perf_counter()
+        rng, index, grid, pending, stats = (self.rng, self.index, self.grid,
+                                            self.pending, self.stats)
+        min_lat, max_lat, min_lon, max_lon = self.bounds
+        outbound = {}
+        while True:
+            next_arrival = pending[0][0] if pending else end
+            if self.next_departure < end and self.next_departure <= next_arrival:
+                now = int(self.next_departure)
+                self.next_departure += rng.expovariate(self.rate)
+                origin = index.find(grid.nearest(rng.uniform(min_lat, max_lat),
+                                                 rng.uniform(min_lon, max_lon)))
+                if not rent_bike(origin[STATION_ID_INDEX], index):
+                    stats['failed_rentals'] += 1
+                    continue
+                stats['departures'] += 1
+                destination = rng.choice(directory)
+                arrival = (now + _trip_seconds(origin, destination), destination[0])
+                if destination[1] == self.region:
+                    heappush(pending, arrival)
+                else:
+                    outbound.setdefault(destination[1], []).append(arrival)
+                    stats['outbound'] += 1
+            elif next_arrival < end:
+                _, station_id = heappop(pending)
+                stats['arrivals'] += 1
+                if return_bike(station_id, index):
+                    continue
+                station = index.find(station_id)
+                nearby = grid.k_nearest(station[LAT_INDEX], station[LON_INDEX],
+                                        RETURN_ALTERNATIVES + 1)
+                if any(return_bike(other, index) for other in nearby if other != station_id):
+                    stats['rerouted_returns'] += 1
+                else:
+                    stats['failed_returns'] += 1
+            else:
+                break
+        stats['seconds'] += time.perf_counter() - began
+        return outbound
+
+
+def _region(region: int) -> _Region:
+    """
+    Returns the state of a region in this worker, setting it up on first use.
+    """
+    state = worker_state()
+    regions = state.setdefault('live', {})
+    if region not in regions:
+        stations, rate = state['regions'][region]
+        regions[region] = _Region(region, stations, rate, state['seed'])
+    return regions[region]
+
+
+def _run_epoch(task: tuple) -> tuple:
+    """
+    Deliver a region's inbound trips and simulate it to the end of an epoch.
+
+    Args:
+    task (tuple): (region, inbound (arrival time, station ID) pairs, end).
+
+    Returns:
+    tuple: (region, outbound arrivals by region).
+    """
+    region, inbound, end = task
+    state = _region(region)
+    for arrival in inbound:
+        heappush(state.pending, arrival)
+    return region, state.run(end, worker_state()['directory'])
+
+
+def _finish(region: int) -> tuple:
+    """
+    Returns (region, station rows, stats) of a region at the end of the run.
+    """
+    state = _region(region)
+    return region, state.stations, state.stats
+
+
+# Function: simulate_city_day
+def simulate_city_day(stations, num_regions: int = 4,
+                      trips_per_day: int = DEFAULT_TRIPS_PER_DAY,
+                      duration: int = SECONDS_PER_DAY,
+                      exchange_interval: int = DEFAULT_EXCHANGE_INTERVAL,
+                      seed: int = 0, max_workers: int = None) -> dict:
+    """
+    Simulate duration seconds of trips over the given stations, which are
+    copied rather than changed.
+
+    Args:
+    stations (list or StationIndex): A list of lists representing multiple stations.
+    num_regions (int): The number of regions to simulate in parallel.
+    trips_per_day (int): The expected number of trip requests per day.
+    duration (int): The number of seconds to simulate.
+    exchange_interval (int): The number of seconds between exchanges of
+        cross-region trips, from 1 to MIN_TRIP_SECONDS.
+    seed (int): The seed for the random trip generator.
+    max_workers (int): The number of worker processes, each keeping some of
+        the regions, 0 to simulate in this process, or None for one per
+        region up to the number of CPUs.
+
+    Returns:
+    dict: {'regions': a list of per-region stats, 'totals': the stats summed
+    over all regions, 'stations': the station rows at the end of the
+    simulation}. Each region's stats include its trips per second of worker
+    time as 'throughput'.
+
+    Raises:
+    ValueError: If exchange_interval is outside 1 to MIN_TRIP_SECONDS, which
+        would let a trip end in another region before it is delivered.
+    """
+    if not 0 < exchange_interval <= MIN_TRIP_SECONDS:
+        raise ValueError(f'exchange_interval must be from 1 to {MIN_TRIP_SECONDS} '
+                         f'seconds, not {exchange_interval}')
+    regions = partition_stations([list(station) for station in stations], num_regions)
+    directory = [(station[STATION_ID_INDEX], region, station[LAT_INDEX], station[LON_INDEX])
+                 for region in range(len(regions)) for station in regions[region]]
+    if not regions:
+        return {'regions': [], 'totals': {}, 'stations': []}
+    total = sum(len(region) for region in regions)
+    rates = [trips_per_day * len(region) / total / SECONDS_PER_DAY for region in regions]
+
+    # Region r is kept by worker r % len(executors) for the whole run.
+    if max_workers == 0:
+        slots = 1
+    else:
+        slots = min(len(regions), max_workers or os.cpu_count() or 1)
+    executors = []
+    try:
+        for slot in range(slots):
+            owned = {region: (regions[region], rates[region])
+                     for region in range(slot, len(regions), slots)}
+            executors.append(start_workers(0 if max_workers == 0 else 1,
+                                           {'directory': directory, 'seed': seed,
+                                            'regions': owned}))
+
+        def run_all(function, tasks_of) -> list:
+            # Submit to every worker before waiting for any of them.
+            results = [map_tasks(executor, function, tasks_of(slot))
+                       for slot, executor in enumerate(executors)]
+            return [result for slot_results in results for result in slot_results]
+
+        inbound = [[] for _ in regions]
+        for start in range(0, duration, exchange_interval):
+            end = min(start + exchange_interval, duration)
+            results = run_all(_run_epoch, lambda slot: [
+                (region, inbound[region], end)
+                for region in range(slot, len(regions), slots)])
+            inbound = [[] for _ in regions]
+            for _, outbound in results:
+                for other, arrivals in outbound.items():
+                    inbound[other].extend(arrivals)
+
+        region_stats = [None] * len(regions)
+        for region, region_stations, stats in run_all(
+                _finish, lambda slot: range(slot, len(regions), slots)):
+            regions[region] = region_stations
+            region_stats[region] = stats
+    finally:
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown()
+
+    totals = {}
+    for stats in region_stats:
+        stats['throughput'] = stats['departures'] / stats['seconds'] if stats['seconds'] else 0.0
+        for name, value in stats.items():
+            if name != 'throughput':
+                totals[name] = totals.get(name, 0) + value
+    return {'regions': region_stats, 'totals': totals,
+            'stations': [station for region in regions for station in region]}
+
+
+if __name__ == '__main__':
+    from instrumentation import enable_from_environment
+    from station_loader import load_stations
+
+    enable_from_environment()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('stations', help='station file in the stations.csv format')
+    parser.add_argument('--regions', type=int, default=4)
+    parser.add_argument('--trips', type=int, default=DEFAULT_TRIPS_PER_DAY)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    result = simulate_city_day(list(load_stations(args.stations)), args.regions,
+                               args.trips, seed=args.seed, max_workers=args.workers)
+    for region, stats in enumerate(result['regions']):
+        print(f"region {region}: {stats['departures']} trips, "
+              f"{stats['throughput']:.0f} trips/s")
+    print('totals:', result['totals'])
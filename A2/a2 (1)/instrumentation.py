@@ -0,0 +1,329 @@
+"""
+Opt-in call counts and latency histograms for the bike_share functions.
+
+enable replaces the chosen functions in the bike_share module, and in every
+loaded module that imported them by name, with wrappers that count calls and
+time them with time.perf_counter_ns. Latencies go into histograms with one
+bucket per power of two nanoseconds. disable puts the original functions
+back, so code that is not being measured pays nothing.
+
+Nothing is wrapped until enable is called, or until enable_from_environment
+is called with the BIKE_SHARE_INSTRUMENT environment variable set to the
+path of a dump file. The station service and fleet simulation scripts call
+it at start-up, and so does every worker_pool worker; any other script can
+be run under this module instead:
+
+    BIKE_SHARE_INSTRUMENT=calls.json python instrumentation.py script.py ...
+
+Each process then rewrites its own dump file, with its process ID in the
+name, every DEFAULT_DUMP_INTERVAL seconds and once more when it exits, and
+merge_dumps adds up the dumps of all the processes.
+
+Counters are updated without a lock, so calls made at the same moment from
+several threads may occasionally be missed.
+"""
+
+import atexit
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from functools import wraps
+from multiprocessing.util import Finalize
+
+import bike_share
+
+# The public functions wrapped by default.
+DEFAULT_FUNCTIONS = (
+    'convert_data', 'get_station_info', 'get_column_sum',
+    'get_stations_with_kiosks', 'get_nearest_station', 'rent_bike',
+    'return_bike', 'upgrade_stations', 'apply_transactions',
+)
+HISTOGRAM_BUCKETS = 64  # Bucket b counts latencies below 2 ** b nanoseconds
+DEFAULT_DUMP_INTERVAL = 60.0  # Seconds between dumps
+INSTRUMENT_ENV = 'BIKE_SHARE_INSTRUMENT'
+
+# name -> [calls, total nanoseconds, histogram]
+_stats = {}
+# (module, name) -> the original function, for every attribute replaced
+_originals = {}
+_dumper = None
+# The process enable_from_environment last started dumping in.
+_environment_process = None
+
+
+def _wrap(name: str, function):
+    record = _stats.setdefault(name, [0, 0, [0] * HISTOGRAM_BUCKETS])
+    histogram = record[2]
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        began = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter_ns() - began
+            record[0] += 1
+            record[1] += elapsed
+            histogram[min(elapsed.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    return wrapper
+
+
+# Function: enable
+def enable(functions=DEFAULT_FUNCTIONS) -> None:
+    """
+    Start measuring the named bike_share functions. Every loaded module
+    that imported one of them with from bike_share import ... has its copy
+    replaced too, as long as it is still the bike_share function; modules
+    imported later copy the wrapper. Calling enable again adds functions,
+    and replaces copies in modules loaded since, without resetting the
+    counts.
+
+    Args:
+    functions (iterable): The names of the bike_share functions to measure.
+    """
+    modules = [module for module in list(sys.modules.values())
+               if module is not None and module is not bike_share]
+    for name in functions:
+        key = (bike_share, name)
+        if key in _originals:
+            wrapper = getattr(bike_share, name)
+        else:
+            _originals[key] = getattr(bike_share, name)
+            wrapper = _wrap(name, _originals[key])
+            setattr(bike_share, name, wrapper)
+        for module in modules:
+            # vars() rather than getattr, so no module __getattr__ is run.
+            if vars(module).get(name) is _originals[key]:
+                _originals[(module, name)] = _originals[key]
+                setattr(module, name, wrapper)
+
+
+# Function: disable
+def disable() -> None:
+    """
+    Put back every original function replaced by enable and stop any
+    periodic dump. The counts are kept until reset.
+    """
+    stop_dump()
+    for (module, name), function in _originals.items():
+        setattr(module, name, function)
+    _originals.clear()
+
+
+# Function: reset
+def reset() -> None:
+    """
+    Set every count and histogram back to zero.
+    """
+    for record in _stats.values():
+        record[0] = record[1] = 0
+        record[2][:] = [0] * HISTOGRAM_BUCKETS
+
+
+def _percentile(histogram: list, calls: int, percent: float) -> float:
+    """
+    Returns the upper bound in microseconds of the histogram bucket that
+    holds the given percentile.
+    """
+    rank = percent / 100 * calls
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if count and seen >= rank:
+            return (1 << bucket) / 1000
+    return 0.0
+
+
+def _summary(calls: int, total: int, histogram: list) -> dict:
+    """
+    Returns the snapshot entry of one function from its call count, total
+    nanoseconds and histogram.
+    """
+    return {
+        'calls': calls,
+        'seconds': total / 1e9,
+        'mean_us': total / calls / 1000 if calls else 0.0,
+        'p50_us': _percentile(histogram, calls, 50),
+        'p99_us': _percentile(histogram, calls, 99),
+        'histogram': {(1 << bucket) / 1000: count
+                      for bucket, count in enumerate(histogram) if count},
+    }
+
+
+# Function: snapshot
+def snapshot() -> dict:
+    """
+    Returns the measurements so far.
+
+    Returns:
+    dict: A mapping from function name to its 'calls', total 'seconds',
+    'mean_us', 'p50_us' and 'p99_us' (upper bounds of the histogram buckets
+    holding those percentiles) and 'histogram', a mapping from bucket upper
+    bound in microseconds to the number of calls in that bucket.
+    """
+    return {name: _summary(calls, total, list(histogram))
+            for name, (calls, total, histogram) in _stats.items()}
+
+
+# Function: dump
+def dump(path: str) -> None:
+    """
+    Write a snapshot to a JSON file, replacing it in one step so that
+    readers never see a partly written file. Each call writes its own
+    temporary file next to path, so processes and threads dumping to the
+    same path do not interfere.
+
+    Args:
+    path (str): The file to write.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(handle, 'w') as dump_file:
+            json.dump({'time': time.time(), 'pid': os.getpid(), 'functions': snapshot()},
+                      dump_file, indent=2)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+# Function: start_dump
+def start_dump(path: str, interval: float = DEFAULT_DUMP_INTERVAL) -> None:
+    """
+    Dump a snapshot to path every interval seconds from a background
+    thread, replacing any dump already running.
+
+    Args:
+    path (str): The file to write.
+    interval (float): The number of seconds between dumps.
+    """
+    global _dumper
+    stop_dump()
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            dump(path)
+
+    thread = threading.Thread(target=run, name='bike_share-dump', daemon=True)
+    _dumper = (thread, stopped, path, os.getpid())
+    thread.start()
+
+
+# Function: stop_dump
+def stop_dump() -> None:
+    """
+    Stop the periodic dump, if one is running, after writing a last snapshot.
+    A dump started by the parent of a forked process is only forgotten.
+    """
+    global _dumper
+    if _dumper is not None:
+        thread, stopped, path, process = _dumper
+        _dumper = None
+        if process == os.getpid():
+            stopped.set()
+            thread.join()
+            dump(path)
+
+
+# Function: process_dump_path
+def process_dump_path(path: str) -> str:
+    """
+    Returns the dump file of this process for a BIKE_SHARE_INSTRUMENT path:
+    the path with the process ID before its extension, so calls.json becomes
+    calls.<pid>.json and processes do not overwrite each other's dumps.
+
+    Args:
+    path (str): The BIKE_SHARE_INSTRUMENT path.
+
+    Returns:
+    str: The dump file of this process.
+    """
+    root, extension = os.path.splitext(path)
+    return f'{root}.{os.getpid()}{extension}'
+
+
+# Function: enable_from_environment
+def enable_from_environment() -> str:
+    """
+    If BIKE_SHARE_INSTRUMENT is set, measure the default functions in this
+    process and dump them to its process_dump_path periodically and when
+    the process exits, including worker processes, which skip atexit.
+    Counts a forked process inherited from its parent are dropped first.
+    Calling it again in the same process changes nothing.
+
+    Returns:
+    str: The dump file of this process, or None if BIKE_SHARE_INSTRUMENT is
+    not set.
+    """
+    global _environment_process
+    path = os.environ.get(INSTRUMENT_ENV)
+    if not path:
+        return None
+    if _environment_process != os.getpid():
+        if _environment_process is not None:
+            reset()
+        _environment_process = os.getpid()
+        enable()
+        start_dump(process_dump_path(path))
+        Finalize(None, stop_dump, exitpriority=0)
+    return process_dump_path(path)
+
+
+# Function: merge_dumps
+def merge_dumps(path: str) -> dict:
+    """
+    Returns the measurements dumped by every process for a
+    BIKE_SHARE_INSTRUMENT path, added together.
+
+    Args:
+    path (str): The BIKE_SHARE_INSTRUMENT path.
+
+    Returns:
+    dict: The combined measurements, in the form snapshot returns.
+    """
+    root, extension = os.path.splitext(path)
+    merged = {}
+    for dump_path in glob.glob(f'{glob.escape(root)}.*{glob.escape(extension)}'):
+        if not dump_path[len(root) + 1:len(dump_path) - len(extension)].isdigit():
+            continue
+        with open(dump_path) as dump_file:
+            functions = json.load(dump_file)['functions']
+        for name, measured in functions.items():
+            record = merged.setdefault(name, [0, 0, [0] * HISTOGRAM_BUCKETS])
+            record[0] += measured['calls']
+            record[1] += round(measured['seconds'] * 1e9)
+            for bound, count in measured['histogram'].items():
+                record[2][round(float(bound) * 1000).bit_length() - 1] += count
+    return {name: _summary(*record) for name, record in merged.items()}
+
+
+# Write the last snapshot of a periodic dump when the program exits.
+atexit.register(stop_dump)
+
+
+if __name__ == '__main__':
+    import argparse
+    import runpy
+
+    parser = argparse.ArgumentParser(
+        description='Run a Python script with the bike_share functions measured.')
+    parser.add_argument('script', help='the script to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='its arguments')
+    args = parser.parse_args()
+    if not os.environ.get(INSTRUMENT_ENV):
+        parser.error(f'set {INSTRUMENT_ENV} to the path of the dump file')
+
+    # Measure through the importable module, which the script and the
+    # worker processes share, rather than through this __main__ copy.
+    import instrumentation
+    instrumentation.enable_from_environment()
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    runpy.run_path(args.script, run_name='__main__')
@@ -0,0 +1,146 @@
+"""
+A thread-safe bike inventory built on the bike_share rent and return rules.
+
+ConcurrentInventory guards stations with a fixed set of striped locks: each
+station ID hashes to one stripe, so rentals and returns at stations on
+different stripes do not wait for each other, while operations on the same
+station are serialised and can never take its bikes or docks below zero.
+
+Listeners of a StationIndex, such as StationTotals or a ChangeLog, keep
+state shared by every station, so when the stations have listeners each
+change is also made under one listener lock, and the listeners are told
+about one change at a time.
+"""
+
+from contextlib import contextmanager
+from threading import Lock
+
+from bike_share import (NUM_BIKES_AVAILABLE_INDEX, NUM_DOCKS_AVAILABLE_INDEX,
+                        StationIndex, adjust_station, get_station_info,
+                        rent_bike, return_bike)
+
+DEFAULT_STRIPES = 64
+
+
+# Class: ConcurrentInventory
+class ConcurrentInventory:
+    """
+    Thread-safe rent, return and compare-and-set operations over stations.
+
+    Attributes:
+    stations (StationIndex or StationTable): The stations, indexed by ID.
+    listener_lock (Lock): Held, after the station's lock, while a station
+        with listeners attached to its container is changed. Hold it to
+        read the listeners' state while other threads make changes.
+    """
+
+    def __init__(self, stations, num_stripes: int = DEFAULT_STRIPES) -> None:
+        """
+        Build the inventory over the given stations. A plain list of
+        stations is wrapped in a StationIndex; any container with a find
+        method is used as it is.
+
+        Args:
+        stations (list, StationIndex or StationTable): The stations to guard.
+        num_stripes (int): The number of locks to spread the stations over.
+        """
+        if not hasattr(stations, 'find'):
+            stations = StationIndex(stations)
+        self.stations = stations
+        self.listener_lock = Lock()
+        self._locks = [Lock() for _ in range(num_stripes)]
+
+    def lock_for(self, station_id: int) -> Lock:
+        """
+        Returns the lock that guards the station with the given ID.
+
+        Args:
+        station_id (int): The station ID.
+
+        Returns:
+        Lock: The station's lock.
+        """
+        return self._locks[hash(station_id) % len(self._locks)]
+
+    @contextmanager
+    def _changing(self, station_id: int):
+        """
+        Hold the station's lock, and the listener lock too if the stations
+        have listeners, for a change to the station.
+        """
+        with self.lock_for(station_id):
+            if getattr(self.stations, 'listeners', None):
+                with self.listener_lock:
+                    yield
+            else:
+                yield
+
+    def rent(self, station_id: int) -> bool:
+        """
+        Rent a bike from a station, as rent_bike does, while holding the
+        station's lock.
+
+        Args:
+        station_id (int): The station ID to rent a bike from.
+
+        Returns:
+        bool: True if the bike rental is successful, False otherwise.
+        """
+        with self._changing(station_id):
+            return rent_bike(station_id, self.stations)
+
+    def return_(self, station_id: int) -> bool:
+        """
+        Return a bike to a station, as return_bike does, while holding the
+        station's lock.
+
+        Args:
+        station_id (int): The station ID to return a bike to.
+
+        Returns:
+        bool: True if the bike return is successful, False otherwise.
+        """
+        with self._changing(station_id):
+            return return_bike(station_id, self.stations)
+
+    def get_info(self, station_id: int) -> list:
+        """
+        Returns get_station_info for a station, read while holding the
+        station's lock so the bike and dock counts are consistent.
+
+        Args:
+        station_id (int): The station ID to search for.
+
+        Returns:
+        list: [station name, number of bikes available, number of docks available, has_kiosk].
+        """
+        with self.lock_for(station_id):
+            return get_station_info(station_id, self.stations)
+
+    def compare_and_set(self, station_id: int, expected_bikes: int,
+                        new_bikes: int) -> bool:
+        """
+        Set the number of bikes at a station to new_bikes, but only if it is
+        currently expected_bikes. Docks change by the opposite amount, so the
+        station's total of bikes and docks stays the same.
+
+        Args:
+        station_id (int): The station ID to update.
+        expected_bikes (int): The number of bikes the caller last saw.
+        new_bikes (int): The number of bikes to set.
+
+        Returns:
+        bool: True if the station was updated, False if it does not exist,
+            its bike count has changed, or the update would take its bikes or
+            docks below zero.
+        """
+        with self._changing(station_id):
+            station = self.stations.find(station_id)
+            if station is None or station[NUM_BIKES_AVAILABLE_INDEX] != expected_bikes:
+                return False
+            delta = new_bikes - expected_bikes
+            if new_bikes < 0 or station[NUM_DOCKS_AVAILABLE_INDEX] - delta < 0:
+                return False
+            adjust_station(self.stations, station, NUM_BIKES_AVAILABLE_INDEX, delta)
+            adjust_station(self.stations, station, NUM_DOCKS_AVAILABLE_INDEX, -delta)
+            return True
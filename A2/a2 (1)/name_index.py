@@ -0,0 +1,129 @@
+"""
+Search stations by name.
+
+NameIndex splits every station name into lower-case words, such as the
+street names in 'Bloor St W / Huron St', and keeps the distinct words in a
+sorted list. A word prefix is found with one bisect and a walk over the
+words that start with it. Substring searches check each distinct name once,
+however many stations share it.
+"""
+
+import re
+from bisect import bisect_left
+
+from bike_share import NAME_INDEX, STATION_ID_INDEX, StationListener
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+# Function: name_words
+def name_words(name: str) -> set:
+    """
+    Returns the lower-case words in a station name.
+
+    Args:
+    name (str): A station name.
+
+    Returns:
+    set: The words of the name.
+    """
+    return set(_WORD.findall(name.lower()))
+
+
+# Class: NameIndex
+class NameIndex(StationListener):
+    """
+    A word and substring index of station names. It can be attached to a
+    StationIndex as a listener to follow stations being added and removed.
+
+    Attributes:
+    words (list): The distinct words of all names, in sorted order.
+    by_word (dict): A mapping from word to a dict of the IDs of the stations
+        whose names contain it.
+    by_name (dict): A mapping from name to a dict of the IDs of the stations
+        with that name.
+    """
+
+    def __init__(self, stations=()) -> None:
+        """
+        Index the names of the given stations, and attach to stations if it
+        accepts listeners, as a StationIndex does.
+
+        Args:
+        stations (list or StationIndex): A list of lists representing multiple stations.
+        """
+        self.words = []
+        self.by_word = {}
+        self.by_name = {}
+        self._positions = {}
+        self._next_position = 0
+        for station in stations:
+            self.station_added(station)
+        if hasattr(stations, 'add_listener'):
+            stations.add_listener(self)
+
+    def station_added(self, station: list) -> None:
+        station_id = station[STATION_ID_INDEX]
+        name = station[NAME_INDEX]
+        self._positions[station_id] = self._next_position
+        self._next_position += 1
+        self.by_name.setdefault(name, {})[station_id] = None
+        for word in name_words(name):
+            if word not in self.by_word:
+                self.by_word[word] = {}
+                self.words.insert(bisect_left(self.words, word), word)
+            self.by_word[word][station_id] = None
+
+    def station_removed(self, station: list) -> None:
+        station_id = station[STATION_ID_INDEX]
+        name = station[NAME_INDEX]
+        del self._positions[station_id]
+        del self.by_name[name][station_id]
+        if not self.by_name[name]:
+            del self.by_name[name]
+        for word in name_words(name):
+            del self.by_word[word][station_id]
+            if not self.by_word[word]:
+                del self.by_word[word]
+                del self.words[bisect_left(self.words, word)]
+
+    def _in_order(self, station_ids) -> list:
+        return sorted(station_ids, key=self._positions.__getitem__)
+
+    def search_prefix(self, prefix: str) -> list:
+        """
+        Returns the IDs of the stations with a word in their name that starts
+        with prefix, ignoring case, in list order.
+
+        Args:
+        prefix (str): The start of a word, such as 'bloo' for Bloor.
+
+        Returns:
+        list: The matching station IDs.
+        """
+        prefix = prefix.lower()
+        found = set()
+        for position in range(bisect_left(self.words, prefix), len(self.words)):
+            word = self.words[position]
+            if not word.startswith(prefix):
+                break
+            found.update(self.by_word[word])
+        return self._in_order(found)
+
+    def search_substring(self, text: str) -> list:
+        """
+        Returns the IDs of the stations whose name contains text, ignoring
+        case, in list order.
+
+        Args:
+        text (str): The text to look for, such as 'queen st'.
+
+        Returns:
+        list: The matching station IDs.
+        """
+        text = text.lower()
+        found = set()
+        for name, station_ids in self.by_name.items():
+            if text in name.lower():
+                found.update(station_ids)
+        return self._in_order(found)
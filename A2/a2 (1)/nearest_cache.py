@@ -0,0 +1,122 @@
+"""
+A cache of nearest-station results for repeated query locations.
+
+NearestStationCache rounds each query point down to a cell of a grid of
+grid_size degrees and remembers the nearest station to the centre of that
+cell, so queries that repeat from the same place with a little GPS jitter
+are answered from a dict. Cells are kept in an OrderedDict in order of use
+and the least recently used cell is dropped once max_entries are held.
+Every answer for a cell is the nearest station to its centre, which is at
+most half a cell diagonal away from the query point.
+
+The cache is cleared whenever a station is added or removed through a
+StationIndex it is attached to. Changes in bike and dock counts do not
+affect the nearest station and keep the cache.
+"""
+
+from collections import OrderedDict
+from math import floor
+
+from bike_share import StationListener, get_nearest_station
+
+DEFAULT_GRID_SIZE = 0.0005  # Cell size in degrees (about 55 m of latitude)
+DEFAULT_MAX_ENTRIES = 4096
+
+
+# Class: NearestStationCache
+class NearestStationCache(StationListener):
+    """
+    An LRU cache in front of a nearest-station search.
+
+    Attributes:
+    grid_size (float): The width and height of a cache cell, in degrees.
+    max_entries (int): The largest number of cells kept.
+    entries (OrderedDict): A mapping from (row, column) cell to station ID,
+        least recently used first.
+    hits (int): The number of queries answered from the cache.
+    misses (int): The number of queries that needed a search.
+    evictions (int): The number of cells dropped to stay within max_entries.
+    """
+
+    def __init__(self, stations, grid_size: float = DEFAULT_GRID_SIZE,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, search=None) -> None:
+        """
+        Prepare an empty cache over the given stations, and attach to
+        stations if it accepts listeners, as a StationIndex does.
+
+        Args:
+        stations (list or StationIndex): A list of lists representing multiple stations.
+        grid_size (float): The width and height of a cache cell, in degrees.
+        max_entries (int): The largest number of cells kept.
+        search (callable): Called as search(lat, lon) on a miss, such as the
+            nearest method of a StationGrid. None searches stations with
+            get_nearest_station.
+        """
+        self.stations = stations
+        self.grid_size = grid_size
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if search is None:
+            search = lambda lat, lon: get_nearest_station(lat, lon, stations)
+        self._search = search
+        if hasattr(stations, 'add_listener'):
+            stations.add_listener(self)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def station_added(self, station: list) -> None:
+        self.clear()
+
+    def station_removed(self, station: list) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        Drop every cached cell. The counters are kept.
+        """
+        self.entries.clear()
+
+    def get_nearest_station(self, lat: float, lon: float) -> int:
+        """
+        Returns the station ID of the nearest station to the centre of the
+        cache cell holding the given coordinates.
+
+        Args:
+        lat (float): Latitude of the current location.
+        lon (float): Longitude of the current location.
+
+        Returns:
+        int: The station ID of the nearest station.
+        """
+        cell = (floor(lat / self.grid_size), floor(lon / self.grid_size))
+        station_id = self.entries.get(cell)
+        if station_id is not None:
+            self.hits += 1
+            self.entries.move_to_end(cell)
+            return station_id
+
+        self.misses += 1
+        station_id = self._search((cell[0] + 0.5) * self.grid_size,
+                                  (cell[1] + 0.5) * self.grid_size)
+        self.entries[cell] = station_id
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return station_id
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+
+        Returns:
+        dict: The 'hits', 'misses', 'evictions' and 'size' of the cache, and
+        its 'hit_rate', the share of queries answered from the cache.
+        """
+        queries = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.entries),
+                'hit_rate': self.hits / queries if queries else 0.0}
@@ -0,0 +1,183 @@
+"""
+Parse large station archives on several cores.
+
+Files in the stations.csv format are cut into byte ranges of about
+chunk_size bytes, each starting at the beginning of a line, so a large file
+is shared between workers as well as a large number of files. Each worker
+on a ProcessPoolExecutor parses its range with the station_loader schema
+into one array.array per numeric column plus a list of names, which are
+sent back to the parent as compact buffers rather than as lists of rows.
+The parent appends the chunks, in file order, to a StationTable with
+StationTable.extend_columns, or records each file as one snapshot of a
+StationHistory.
+
+Fields are assumed not to contain line breaks, which holds for the station
+feed.
+"""
+
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from bike_share import (NAME_INDEX, NUM_BIKES_AVAILABLE_INDEX,
+                        NUM_DOCKS_AVAILABLE_INDEX, STATION_ID_INDEX)
+from station_history import StationHistory
+from station_loader import iter_stations
+from station_table import COLUMN_TYPECODES, StationTable
+
+DEFAULT_CHUNK_SIZE = 8 << 20  # Bytes of CSV per task
+ENCODING = 'utf-8'
+
+
+# Function: split_file
+def split_file(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple:
+    """
+    Returns the header line of a CSV file and the byte ranges of its data
+    lines, each about chunk_size bytes long and starting at the beginning
+    of a line.
+
+    Args:
+    path (str): The path of a file in the stations.csv format.
+    chunk_size (int): The approximate length of each range, in bytes.
+
+    Returns:
+    tuple: (header line, a list of (start, end) byte offsets).
+    """
+    ranges = []
+    with open(path, 'rb') as csv_file:
+        header = csv_file.readline()
+        start = csv_file.tell()
+        size = os.fstat(csv_file.fileno()).st_size
+        while start < size:
+            csv_file.seek(max(start, start + chunk_size - 1))
+            csv_file.readline()
+            end = min(csv_file.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return header.decode(ENCODING), ranges
+
+
+# Function: parse_range
+def parse_range(task: tuple) -> tuple:
+    """
+    Parse one byte range of a station file into columns.
+
+    Args:
+    task (tuple): (path, header line, start, end).
+
+    Returns:
+    tuple: (a mapping from row index to an array.array of that field, a list
+    of station names).
+    """
+    path, header, start, end = task
+    with open(path, 'rb') as csv_file:
+        csv_file.seek(start)
+        text = csv_file.read(end - start).decode(ENCODING)
+    columns = {index: array(typecode) for index, typecode in COLUMN_TYPECODES.items()}
+    appenders = [(index, column.append) for index, column in columns.items()]
+    names = []
+    for row in iter_stations(chain([header], text.splitlines())):
+        for index, append in appenders:
+            append(row[index])
+        names.append(row[NAME_INDEX])
+    return columns, names
+
+
+def _parse_files(paths: list, max_workers: int, chunk_size: int):
+    """
+    Yield (file number, columns, names) for every range of every file, in
+    file and range order.
+    """
+    tasks = []
+    owners = []
+    for number, path in enumerate(paths):
+        header, ranges = split_file(path, chunk_size)
+        for start, end in ranges:
+            tasks.append((path, header, start, end))
+            owners.append(number)
+    if max_workers == 0:
+        results = map(parse_range, tasks)
+        for number, (columns, names) in zip(owners, results):
+            yield number, columns, names
+        return
+    with ProcessPoolExecutor(max_workers) as executor:
+        results = executor.map(parse_range, tasks)
+        for number, (columns, names) in zip(owners, results):
+            yield number, columns, names
+
+
+# Function: ingest_table
+def ingest_table(paths: list, table: StationTable = None, max_workers: int = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> StationTable:
+    """
+    Parse station files in parallel and append their rows, in file order,
+    to a StationTable.
+
+    Args:
+    paths (list): The paths of files in the stations.csv format.
+    table (StationTable): The table to append to, or None for a new one.
+    max_workers (int): The number of worker processes, or 0 to parse in
+        this process.
+    chunk_size (int): The approximate number of bytes parsed per task.
+
+    Returns:
+    StationTable: The table.
+    """
+    if table is None:
+        table = StationTable()
+    for _, columns, names in _parse_files(paths, max_workers, chunk_size):
+        table.extend_columns(columns, names)
+    return table
+
+
+# Function: ingest_history
+def ingest_history(snapshots: list, history: StationHistory = None,
+                   max_workers: int = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> StationHistory:
+    """
+    Parse snapshot files in parallel and record each as one snapshot of a
+    StationHistory.
+
+    Args:
+    snapshots (list): (timestamp, path) pairs, in time order.
+    history (StationHistory): The history to add to, or None for a new one.
+    max_workers (int): The number of worker processes, or 0 to parse in
+        this process.
+    chunk_size (int): The approximate number of bytes parsed per task.
+
+    Returns:
+    StationHistory: The history.
+
+    Raises:
+    ValueError: If the snapshots are not in time order.
+    """
+    if history is None:
+        history = StationHistory()
+    timestamps = [timestamp for timestamp, _ in snapshots]
+
+    def record(number: int, parts: list) -> None:
+        history.append_columns(
+            timestamps[number],
+            chain.from_iterable(columns[STATION_ID_INDEX] for columns in parts),
+            array('q', chain.from_iterable(
+                columns[NUM_BIKES_AVAILABLE_INDEX] for columns in parts)),
+            array('q', chain.from_iterable(
+                columns[NUM_DOCKS_AVAILABLE_INDEX] for columns in parts)))
+
+    # Chunks arrive in file order; parts holds those of file next_number.
+    # A file without data lines is recorded as an empty snapshot.
+    next_number = 0
+    parts = []
+    for number, columns, _ in _parse_files([path for _, path in snapshots],
+                                           max_workers, chunk_size):
+        while next_number < number:
+            record(next_number, parts)
+            parts = []
+            next_number += 1
+        parts.append(columns)
+    while next_number < len(snapshots):
+        record(next_number, parts)
+        parts = []
+        next_number += 1
+    return history
@@ -0,0 +1,293 @@
+"""
+Plan truck routes that move bikes from full stations to empty ones.
+
+A station has a surplus when it holds more bikes than its target, a share of
+its capacity, and a deficit when it holds fewer and has docks free for them.
+Each truck starts at a depot and repeatedly drives to the nearest station
+where it can act: a surplus station while it has room, or a deficit station
+while it carries bikes. The nearest stations are found with StationGrids
+from which visited stations are removed. The route is then shortened with
+2-opt moves, trying for each stop only its nearest neighbours as the next
+stop, and rejecting any move that would leave the truck carrying fewer than
+zero bikes or more than it holds.
+
+With several trucks, the stations are split into regions from west to east
+and each truck serves one region. evaluate_plans plans many candidate
+settings at once on a ProcessPoolExecutor so that they can be compared.
+"""
+
+from bike_share import (CAPACITY_INDEX, LAT_INDEX, LON_INDEX,
+                        NUM_BIKES_AVAILABLE_INDEX, NUM_DOCKS_AVAILABLE_INDEX,
+                        STATION_ID_INDEX, get_lat_lon_distance)
+from fleet_simulation import partition_stations
+from spatial_index import StationGrid
+from worker_pool import map_tasks, start_workers, worker_state
+
+DEFAULT_TARGET_FILL = 0.5  # Share of capacity each station should hold
+DEFAULT_TRUCK_CAPACITY = 20
+DEFAULT_MIN_IMBALANCE = 2  # Smaller imbalances are not worth a stop
+TWO_OPT_NEIGHBOURS = 8
+MAX_TWO_OPT_PASSES = 20
+
+
+# Function: find_imbalances
+def find_imbalances(stations, target_fill: float = DEFAULT_TARGET_FILL,
+                    min_imbalance: int = DEFAULT_MIN_IMBALANCE) -> tuple:
+    """
+    Returns the stations with a surplus and the stations with a deficit of
+    bikes. A station's target is target_fill of its capacity, rounded; a
+    deficit is limited by the docks the station has free.
+
+    Args:
+    stations (list, StationIndex or StationTable): The stations to check.
+    target_fill (float): The share of capacity each station should hold.
+    min_imbalance (int): The smallest surplus or deficit that is reported.
+
+    Returns:
+    tuple: (surplus, deficit), two dicts mapping station ID to a number of bikes.
+    """
+    surplus = {}
+    deficit = {}
+    for station in stations:
+        target = round(station[CAPACITY_INDEX] * target_fill)
+        bikes = station[NUM_BIKES_AVAILABLE_INDEX]
+        if bikes - target >= min_imbalance:
+            surplus.setdefault(station[STATION_ID_INDEX], bikes - target)
+        elif min(target - bikes, station[NUM_DOCKS_AVAILABLE_INDEX]) >= min_imbalance:
+            deficit.setdefault(station[STATION_ID_INDEX],
+                               min(target - bikes, station[NUM_DOCKS_AVAILABLE_INDEX]))
+    return surplus, deficit
+
+
+# Function: route_distance
+def route_distance(route: list, coordinates: dict, start: tuple) -> float:
+    """
+    Returns the length in kilometers of a route from start through its stops.
+
+    Args:
+    route (list): (station ID, change) stops.
+    coordinates (dict): A mapping from station ID to (lat, lon).
+    start (tuple): The (lat, lon) the route starts from.
+
+    Returns:
+    float: The length of the route.
+    """
+    distance = 0.0
+    here = start
+    for station_id, _ in route:
+        there = coordinates[station_id]
+        distance += get_lat_lon_distance(here[0], here[1], there[0], there[1])
+        here = there
+    return distance
+
+
+# Function: plan_route
+def plan_route(stations, start: tuple, truck_capacity: int = DEFAULT_TRUCK_CAPACITY,
+               surplus: dict = None, deficit: dict = None) -> list:
+    """
+    Returns a nearest-neighbour route for one truck, starting empty at
+    start. Each stop is a (station ID, change) pair, where a positive change
+    is a number of bikes picked up and a negative one a number dropped off.
+    The amounts served are taken off surplus and deficit.
+
+    Args:
+    stations (list, StationIndex or StationTable): The stations to serve.
+    start (tuple): The (lat, lon) of the depot.
+    truck_capacity (int): The number of bikes the truck holds.
+    surplus (dict): Bikes to pick up by station ID, or None to use find_imbalances.
+    deficit (dict): Bikes to drop off by station ID, or None to use find_imbalances.
+
+    Returns:
+    list: The (station ID, change) stops, in visiting order.
+    """
+    if surplus is None or deficit is None:
+        surplus, deficit = find_imbalances(stations)
+    rows = {}
+    for station in stations:
+        rows.setdefault(station[STATION_ID_INDEX], station)
+    pickups = StationGrid([rows[station_id] for station_id in surplus if station_id in rows])
+    drops = StationGrid([rows[station_id] for station_id in deficit if station_id in rows])
+
+    route = []
+    lat, lon = start
+    load = 0
+    while True:
+        candidates = []
+        if load < truck_capacity and len(pickups):
+            candidates.append(pickups.nearest(lat, lon))
+        if load > 0 and len(drops):
+            candidates.append(drops.nearest(lat, lon))
+        if not candidates:
+            return route
+        station_id = min(candidates, key=lambda candidate: get_lat_lon_distance(
+            lat, lon, rows[candidate][LAT_INDEX], rows[candidate][LON_INDEX]))
+
+        if station_id in pickups:
+            change = min(surplus[station_id], truck_capacity - load)
+            surplus[station_id] -= change
+            if not surplus[station_id]:
+                del surplus[station_id]
+            pickups.remove(station_id)
+        else:
+            change = -min(deficit[station_id], load)
+            deficit[station_id] += change
+            if not deficit[station_id]:
+                del deficit[station_id]
+            drops.remove(station_id)
+        load += change
+        route.append((station_id, change))
+        lat, lon = rows[station_id][LAT_INDEX], rows[station_id][LON_INDEX]
+
+
+# Function: improve_route
+def improve_route(route: list, coordinates: dict, start: tuple,
+                  truck_capacity: int = DEFAULT_TRUCK_CAPACITY,
+                  neighbours: int = TWO_OPT_NEIGHBOURS) -> list:
+    """
+    Returns a shorter or equal route with the same stops, found by 2-opt:
+    reversing a run of stops whenever that shortens the route and keeps the
+    truck's load between 0 and truck_capacity. Each stop is only tried
+    against its neighbours nearest stops as its new successor.
+
+    Args:
+    route (list): (station ID, change) stops, visiting each station at most once.
+    coordinates (dict): A mapping from station ID to (lat, lon).
+    start (tuple): The (lat, lon) the route starts from.
+    truck_capacity (int): The number of bikes the truck holds.
+    neighbours (int): The number of nearest stops tried for each stop.
+
+    Returns:
+    list: The improved (station ID, change) stops.
+    """
+    stops = [(None, 0)] + list(route)
+    points = [start] + [coordinates[station_id] for station_id, _ in route]
+    grid_rows = []
+    for position in range(1, len(stops)):
+        row = [None] * (LON_INDEX + 1)
+        row[STATION_ID_INDEX] = position
+        row[LAT_INDEX], row[LON_INDEX] = points[position]
+        grid_rows.append(row)
+    grid = StationGrid(grid_rows)
+    nearby = [grid.k_nearest(lat, lon, neighbours) for lat, lon in points]
+
+    def distance(a: int, b: int) -> float:
+        return get_lat_lon_distance(points[a][0], points[a][1], points[b][0], points[b][1])
+
+    # order holds positions in stops; where maps each position to its place
+    # in order; loads[i] is the load after the stop at order[i].
+    order = list(range(len(stops)))
+    where = list(range(len(stops)))
+    for _ in range(MAX_TWO_OPT_PASSES):
+        loads = [0] * len(order)
+        for i in range(1, len(order)):
+            loads[i] = loads[i - 1] + stops[order[i]][1]
+        improved = False
+        for i in range(len(order) - 2):
+            a, b = order[i], order[i + 1]
+            for c in nearby[a]:
+                j = where[c]
+                if j <= i + 1:
+                    continue
+                # Replace edges a-b and c-d by a-c and b-d, reversing b..c.
+                gain = distance(a, b) - distance(a, c)
+                if j + 1 < len(order):
+                    d = order[j + 1]
+                    gain += distance(c, d) - distance(b, d)
+                if gain <= 1e-9:
+                    continue
+                low = loads[i] + loads[j] - truck_capacity
+                high = loads[i] + loads[j]
+                if any(not low <= loads[m] <= high for m in range(i, j)):
+                    continue
+                order[i + 1:j + 1] = order[j:i:-1]
+                for m in range(i + 1, j + 1):
+                    where[order[m]] = m
+                    loads[m] = loads[m - 1] + stops[order[m]][1]
+                improved = True
+                break
+        if not improved:
+            break
+    return [stops[position] for position in order[1:]]
+
+
+# Function: plan_rebalancing
+def plan_rebalancing(stations, num_trucks: int = 1,
+                     truck_capacity: int = DEFAULT_TRUCK_CAPACITY,
+                     target_fill: float = DEFAULT_TARGET_FILL,
+                     min_imbalance: int = DEFAULT_MIN_IMBALANCE,
+                     depot: tuple = None) -> dict:
+    """
+    Plan a route for each of num_trucks trucks, each serving one region of
+    the imbalanced stations.
+
+    Args:
+    stations (list, StationIndex or StationTable): The stations to rebalance.
+    num_trucks (int): The number of trucks.
+    truck_capacity (int): The number of bikes each truck holds.
+    target_fill (float): The share of capacity each station should hold.
+    min_imbalance (int): The smallest surplus or deficit worth a stop.
+    depot (tuple): The (lat, lon) every truck starts from, or None to start
+        each truck at the centre of its region.
+
+    Returns:
+    dict: {'routes': a list of (station ID, change) routes, one per truck,
+    'distance': their total length in kilometers, 'moved': the number of
+    bikes dropped off, 'remaining': the surplus and deficit bikes left
+    unserved}.
+    """
+    surplus, deficit = find_imbalances(stations, target_fill, min_imbalance)
+    imbalanced = [station for station in stations
+                  if station[STATION_ID_INDEX] in surplus
+                  or station[STATION_ID_INDEX] in deficit]
+    coordinates = {}
+    for station in imbalanced:
+        coordinates.setdefault(station[STATION_ID_INDEX],
+                               (station[LAT_INDEX], station[LON_INDEX]))
+
+    routes = []
+    distance = 0.0
+    for region in partition_stations(imbalanced, num_trucks):
+        start = depot
+        if start is None:
+            start = (sum(station[LAT_INDEX] for station in region) / len(region),
+                     sum(station[LON_INDEX] for station in region) / len(region))
+        route = plan_route(region, start, truck_capacity, surplus, deficit)
+        route = improve_route(route, coordinates, start, truck_capacity)
+        routes.append(route)
+        distance += route_distance(route, coordinates, start)
+
+    return {'routes': routes, 'distance': distance,
+            'moved': -sum(change for route in routes for _, change in route if change < 0),
+            'remaining': sum(surplus.values()) + sum(deficit.values())}
+
+
+def _evaluate(candidate: dict) -> dict:
+    return {'candidate': candidate,
+            **plan_rebalancing(worker_state()['stations'], **candidate)}
+
+
+# Function: evaluate_plans
+def evaluate_plans(stations, candidates: list, max_workers: int = None) -> list:
+    """
+    Plan the rebalancing for each candidate setting in parallel.
+
+    Args:
+    stations (list, StationIndex or StationTable): The stations to rebalance.
+    candidates (list): Dicts of plan_rebalancing keyword arguments, such as
+        {'num_trucks': 3, 'truck_capacity': 30}.
+    max_workers (int): The number of worker processes, or 0 to plan in
+        this process.
+
+    Returns:
+    list: The result of plan_rebalancing for each candidate, in candidate
+    order, with the candidate itself under 'candidate'. The plan that
+    leaves the fewest bikes unserved over the shortest distance is
+    min(results, key=lambda result: (result['remaining'], result['distance'])).
+    """
+    executor = start_workers(max_workers,
+                             {'stations': [list(station) for station in stations]})
+    try:
+        return list(map_tasks(executor, _evaluate, candidates))
+    finally:
+        if executor is not None:
+            executor.shutdown()
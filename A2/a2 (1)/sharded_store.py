@@ -0,0 +1,299 @@
+"""
+A station store split into shards, such as one per city.
+
+Each shard covers a range of station IDs and a latitude/longitude bounding
+box, and keeps its stations in a snapshot file that is only read the first
+time the shard is used. ShardedStations routes a station ID to the shard
+whose ID range holds it, so get_station_info, rent_bike and return_bike can
+be called on it as on a list of stations, and only that shard is loaded.
+Nearest-station queries visit shards in order of the least distance their
+bounding box allows, and stop at the first shard that cannot hold a closer
+station than the one already found.
+"""
+
+import json
+import os
+from math import cos, radians
+
+from bike_share import (LAT_INDEX, LON_INDEX, STATION_ID_INDEX, StationIndex,
+                        adjust_station, get_lat_lon_distance)
+from spatial_index import StationGrid, gap_lower_bound
+from station_snapshot import open_snapshot, write_snapshot
+from station_table import StationTable
+
+MANIFEST_NAME = 'manifest.json'
+
+
+# Function: box_lower_bound
+def box_lower_bound(lat: float, lon: float, bounds: tuple) -> float:
+    """
+    Returns a distance in kilometers that is no greater than the distance
+    from the given point to any point in a bounding box.
+
+    Args:
+    lat (float): Latitude of the point.
+    lon (float): Longitude of the point.
+    bounds (tuple): (min_lat, min_lon, max_lat, max_lon) of the box.
+
+    Returns:
+    float: The lower bound, 0.0 if the point is in the box.
+    """
+    min_lat, min_lon, max_lat, max_lon = bounds
+    lat_gap = max(0.0, min_lat - lat, lat - max_lat)
+    lon_gap = 0.0
+    if not min_lon <= lon <= max_lon:
+        lon_gap = min((min_lon - lon) % 360, (lon - max_lon) % 360)
+    min_cos = cos(radians(max(abs(lat), abs(min_lat), abs(max_lat))))
+    return gap_lower_bound(lat_gap, lon_gap, min_cos)
+
+
+# Class: Shard
+class Shard:
+    """
+    One shard of a ShardedStations store.
+
+    Attributes:
+    name (str): The name of the shard, such as a city.
+    min_id (int): The smallest station ID in the shard.
+    max_id (int): The largest station ID in the shard.
+    bounds (tuple): (min_lat, min_lon, max_lat, max_lon) of its stations.
+    count (int): The number of stations in the shard.
+    path (str): The snapshot file the stations are loaded from, or None.
+    """
+
+    def __init__(self, name: str, min_id: int, max_id: int, bounds: tuple,
+                 count: int, path: str = None, stations=None) -> None:
+        """
+        Describe a shard whose stations are either given or loaded from path
+        when first needed.
+
+        Args:
+        name (str): The name of the shard.
+        min_id (int): The smallest station ID in the shard.
+        max_id (int): The largest station ID in the shard.
+        bounds (tuple): (min_lat, min_lon, max_lat, max_lon) of its stations.
+        count (int): The number of stations in the shard.
+        path (str): The snapshot file holding the stations, or None.
+        stations (list, StationIndex or StationTable): The stations, or None to
+            load them from path. A plain list is wrapped in a StationIndex.
+        """
+        self.name = name
+        self.min_id = min_id
+        self.max_id = max_id
+        self.bounds = bounds
+        self.count = count
+        self.path = path
+        if stations is not None and not hasattr(stations, 'find'):
+            stations = StationIndex(stations)
+        self._stations = stations
+        self._grid = None
+
+    @classmethod
+    def from_stations(cls, name: str, stations, path: str = None) -> 'Shard':
+        """
+        Returns a loaded shard holding the given stations.
+
+        Args:
+        name (str): The name of the shard.
+        stations (list or StationTable): A non-empty list of lists representing stations.
+        path (str): The snapshot file the shard is saved to, or None.
+
+        Returns:
+        Shard: The shard.
+        """
+        ids = [station[STATION_ID_INDEX] for station in stations]
+        lats = [station[LAT_INDEX] for station in stations]
+        lons = [station[LON_INDEX] for station in stations]
+        return cls(name, min(ids), max(ids), (min(lats), min(lons), max(lats), max(lons)),
+                   len(ids), path, stations)
+
+    @property
+    def loaded(self) -> bool:
+        return self._stations is not None
+
+    @property
+    def stations(self):
+        """
+        The stations of the shard, read from its snapshot file on first use.
+        """
+        if self._stations is None:
+            with open_snapshot(self.path) as snapshot:
+                self._stations = snapshot.to_table()
+        return self._stations
+
+    @property
+    def grid(self) -> StationGrid:
+        """
+        A StationGrid of the shard's stations, built on first use.
+        """
+        if self._grid is None:
+            self._grid = StationGrid(self.stations)
+        return self._grid
+
+    def to_manifest(self) -> dict:
+        """
+        Returns the description of the shard stored in a manifest.
+        """
+        return {'name': self.name, 'min_id': self.min_id, 'max_id': self.max_id,
+                'bounds': list(self.bounds), 'count': self.count,
+                'path': os.path.basename(self.path) if self.path else None}
+
+
+# Class: ShardedStations
+class ShardedStations:
+    """
+    Stations split across shards. It provides find and adjust, so the
+    bike_share functions accept it in place of a list of stations; iterating
+    over it loads every shard.
+
+    Attributes:
+    shards (list): The shards, in list order.
+    """
+
+    def __init__(self, shards: list) -> None:
+        """
+        Build a store over the given shards.
+
+        Args:
+        shards (list): The shards, in list order.
+        """
+        self.shards = list(shards)
+
+    @classmethod
+    def open(cls, directory: str) -> 'ShardedStations':
+        """
+        Open the store saved in a directory by write_shards. No shard is
+        loaded until it is used.
+
+        Args:
+        directory (str): The directory holding the manifest and snapshot files.
+
+        Returns:
+        ShardedStations: The store.
+        """
+        with open(os.path.join(directory, MANIFEST_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+        return cls([Shard(entry['name'], entry['min_id'], entry['max_id'],
+                          tuple(entry['bounds']), entry['count'],
+                          os.path.join(directory, entry['path']))
+                    for entry in manifest['shards']])
+
+    def __len__(self) -> int:
+        return sum(shard.count for shard in self.shards)
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard.stations
+
+    def shard_for(self, station_id: int) -> Shard:
+        """
+        Returns the shard holding the station with the given ID, loading
+        the shards whose ID range includes it as needed, or None if there is
+        no such station.
+
+        Args:
+        station_id (int): The station ID to search for.
+
+        Returns:
+        Shard: The shard, or None.
+        """
+        for shard in self.shards:
+            if shard.min_id <= station_id <= shard.max_id \
+                    and shard.stations.find(station_id) is not None:
+                return shard
+        return None
+
+    def find(self, station_id: int) -> list:
+        """
+        Returns the row of the station with the given ID, or None if there is
+        no such station.
+
+        Args:
+        station_id (int): The station ID to search for.
+
+        Returns:
+        list: The station row, or None.
+        """
+        shard = self.shard_for(station_id)
+        if shard is None:
+            return None
+        return shard.stations.find(station_id)
+
+    def adjust(self, station: list, index: int, delta: int) -> None:
+        """
+        Add delta to the value at the given index of a station row, through
+        the shard that holds it.
+
+        Args:
+        station (list): A station row in the store.
+        index (int): The index of the value to change.
+        delta (int): The amount to add.
+        """
+        shard = self.shard_for(station[STATION_ID_INDEX])
+        adjust_station(shard.stations, station, index, delta)
+
+    def nearest(self, lat: float, lon: float) -> int:
+        """
+        Returns the station ID of the nearest station to the given
+        coordinates, or -1 if there are no stations. Shards are only loaded
+        if their bounding box could hold a station closer than the nearest
+        one found so far. In case of a tie, the station that appears last in
+        list order is chosen, as in get_nearest_station.
+
+        Args:
+        lat (float): Latitude of the current location.
+        lon (float): Longitude of the current location.
+
+        Returns:
+        int: The station ID of the nearest station.
+        """
+        ordered = sorted((box_lower_bound(lat, lon, shard.bounds), position)
+                         for position, shard in enumerate(self.shards) if shard.count)
+        best_distance = float('inf')
+        best_position = -1
+        nearest_station_id = -1
+        for bound, position in ordered:
+            if bound > best_distance:
+                break
+            shard = self.shards[position]
+            station_id = shard.grid.nearest(lat, lon)
+            station = shard.stations.find(station_id)
+            distance = get_lat_lon_distance(lat, lon, station[LAT_INDEX], station[LON_INDEX])
+            if distance < best_distance or (distance == best_distance
+                                            and position > best_position):
+                best_distance = distance
+                best_position = position
+                nearest_station_id = station_id
+        return nearest_station_id
+
+
+# Function: write_shards
+def write_shards(stations, directory: str, shard_key) -> ShardedStations:
+    """
+    Split stations into shards by shard_key and save each shard as a
+    snapshot file in directory, with a manifest describing them. Shards are
+    ordered by the first station in each, so list order is kept when shards
+    hold contiguous runs of the list.
+
+    Args:
+    stations (list, StationIndex or StationTable): The stations to split.
+    directory (str): The directory to write, which is created if needed.
+    shard_key (callable): Returns the shard name of a station row, such as its city.
+
+    Returns:
+    ShardedStations: A store over the written shards, all loaded.
+    """
+    groups = {}
+    for station in stations:
+        groups.setdefault(str(shard_key(station)), []).append(list(station))
+
+    os.makedirs(directory, exist_ok=True)
+    shards = []
+    for number, (name, rows) in enumerate(groups.items()):
+        path = os.path.join(directory, f'shard-{number}.snapshot')
+        write_snapshot(path, rows)
+        shards.append(Shard.from_stations(name, StationTable(rows), path))
+    with open(os.path.join(directory, MANIFEST_NAME), 'w') as manifest_file:
+        json.dump({'shards': [shard.to_manifest() for shard in shards]}, manifest_file,
+                  indent=2)
+    return ShardedStations(shards)
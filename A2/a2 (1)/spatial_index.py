@@ -0,0 +1,521 @@
+"""
+Spatial indexes over bike share stations.
+
+StationGrid buckets stations into the cells of a latitude/longitude grid so
+that nearest-station and range queries only compute distances for stations
+in the cells around the query point, instead of for every station in the
+list. AvailabilityIndex keeps separate grids of the stations that can serve
+a rental and a return, so those queries skip stations that cannot.
+"""
+
+from heapq import heappush, heappushpop
+from math import asin, cos, degrees, floor, radians, sin
+from operator import itemgetter
+
+from bike_share import (EARTH_RADIUS, LAT_INDEX, LON_INDEX,
+                        NUM_BIKES_AVAILABLE_INDEX, NUM_DOCKS_AVAILABLE_INDEX,
+                        STATION_ID_INDEX, StationIndex, StationListener,
+                        can_rent, can_return, get_lat_lon_distance, has_kiosk)
+
+DEFAULT_CELL_SIZE = 0.01  # Grid cell size in degrees (about 1.1 km of latitude)
+
+
+# Function: gap_lower_bound
+def gap_lower_bound(lat_gap: float, lon_gap: float, min_cos: float) -> float:
+    """
+    Returns a distance in kilometers that is no greater than the distance
+    between two points whose latitudes differ by at least lat_gap degrees
+    and whose longitudes differ by at least lon_gap degrees, measured the
+    short way round, where min_cos is at most the cosine of either point's
+    latitude.
+
+    Args:
+    lat_gap (float): The least difference in latitude, in degrees.
+    lon_gap (float): The least difference in longitude, in degrees.
+    min_cos (float): A lower bound on the cosine of both latitudes.
+
+    Returns:
+    float: The lower bound.
+    """
+    lat_bound = EARTH_RADIUS * radians(min(lat_gap, 180.0))
+    lon_bound = 2 * EARTH_RADIUS * asin(
+        min(1.0, max(0.0, min_cos) * sin(radians(min(lon_gap, 180.0)) / 2)))
+    return max(lat_bound, lon_bound)
+
+
+# Class: StationGrid
+class StationGrid:
+    """
+    A uniform latitude/longitude grid of stations.
+
+    Queries search the grid in square rings of cells around the cell that
+    contains the query point and stop as soon as no station in an unvisited
+    cell could be closer than the stations found so far. Distances are
+    computed with get_lat_lon_distance, and ties are broken the same way as
+    get_nearest_station: the station that appears last in list order wins.
+
+    Station IDs are assumed to be unique within a grid.
+
+    Attributes:
+    cell_size (float): The width and height of a grid cell, in degrees.
+    cells (dict): A mapping from (row, column) cell to a list of
+        (position, station) pairs, where position is the station's place in
+        list order.
+    """
+
+    def __init__(self, stations, cell_size: float = DEFAULT_CELL_SIZE) -> None:
+        """
+        Build the grid from the given station rows.
+
+        Args:
+        stations (list or StationIndex): The stations to index.
+        cell_size (float): The width and height of a grid cell, in degrees.
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+        self._cell_of = {}
+        self._next_position = 0
+        self._min_cos = 1.0
+        self._bounds = None
+        for station in stations:
+            self.add(station)
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def __contains__(self, station_id: int) -> bool:
+        return station_id in self._cell_of
+
+    def _cell(self, lat: float, lon: float) -> tuple:
+        """
+        Returns the (row, column) of the cell containing the given point.
+        """
+        return (floor(lat / self.cell_size), floor(lon / self.cell_size))
+
+    def add(self, station: list, position: int = None) -> None:
+        """
+        Add a station to the grid. Unless a position is given, the station is
+        treated as coming after every station already in the grid.
+
+        Args:
+        station (list): A list representing a station.
+        position (int): The station's place in list order, used to break ties.
+        """
+        if position is None:
+            position = self._next_position
+        self._next_position = max(self._next_position, position + 1)
+
+        cell = self._cell(station[LAT_INDEX], station[LON_INDEX])
+        self.cells.setdefault(cell, []).append((position, station))
+        self._cell_of[station[STATION_ID_INDEX]] = cell
+        self._min_cos = min(self._min_cos, cos(radians(station[LAT_INDEX])))
+
+        row, col = cell
+        if self._bounds is None:
+            self._bounds = (row, row, col, col)
+        else:
+            min_row, max_row, min_col, max_col = self._bounds
+            self._bounds = (min(min_row, row), max(max_row, row),
+                            min(min_col, col), max(max_col, col))
+
+    def remove(self, station_id: int) -> list:
+        """
+        Remove the station with the given ID from the grid and return its
+        row, or None if the station is not in the grid.
+
+        Args:
+        station_id (int): The station ID to remove.
+
+        Returns:
+        list: The removed station row, or None.
+        """
+        cell = self._cell_of.pop(station_id, None)
+        if cell is None:
+            return None
+        entries = self.cells[cell]
+        for i in range(len(entries)):
+            if entries[i][1][STATION_ID_INDEX] == station_id:
+                station = entries.pop(i)[1]
+                break
+        if not entries:
+            del self.cells[cell]
+        return station
+
+    def _ring_bound(self, ring: int, min_cos: float, wrap_gap: float) -> float:
+        """
+        Returns a distance in kilometers that is no greater than the distance
+        from the query point to any station ring or more cells away, where
+        min_cos is at most the cosine of the query's and every station's
+        latitude, and wrap_gap is the least longitude difference of any
+        station going round the other way.
+        """
+        degrees = (ring - 1) * self.cell_size
+        return min(gap_lower_bound(degrees, 0.0, min_cos),
+                   gap_lower_bound(0.0, min(degrees, wrap_gap), min_cos))
+
+    def _ring_cost(self, row: int, col: int, ring: int) -> int:
+        """
+        Returns the number of cells _ring looks up for the given ring.
+        """
+        min_row, max_row, min_col, max_col = self._bounds
+        cols = max(0, min(col + ring, max_col) - max(col - ring, min_col) + 1)
+        rows = max(0, min(row + ring - 1, max_row) - max(row - ring + 1, min_row) + 1)
+        return 2 * (cols + rows)
+
+    def _ring(self, row: int, col: int, ring: int) -> list:
+        """
+        Returns the occupied cells whose row or column is exactly ring cells
+        away from (row, col).
+        """
+        if ring == 0:
+            cell = self.cells.get((row, col))
+            return [cell] if cell else []
+
+        # Only look at the part of the ring that overlaps the occupied cells.
+        min_row, max_row, min_col, max_col = self._bounds
+        first_col = max(col - ring, min_col)
+        last_col = min(col + ring, max_col)
+        first_row = max(row - ring + 1, min_row)
+        last_row = min(row + ring - 1, max_row)
+        found = []
+        for r in (row - ring, row + ring):
+            if min_row <= r <= max_row:
+                for c in range(first_col, last_col + 1):
+                    cell = self.cells.get((r, c))
+                    if cell:
+                        found.append(cell)
+        for c in (col - ring, col + ring):
+            if min_col <= c <= max_col:
+                for r in range(first_row, last_row + 1):
+                    cell = self.cells.get((r, c))
+                    if cell:
+                        found.append(cell)
+        return found
+
+    def k_nearest(self, lat: float, lon: float, k: int) -> list:
+        """
+        Returns the station IDs of the k nearest stations to the given
+        coordinates, nearest first. Among stations at the same distance, the
+        one that appears later in the list comes first.
+
+        Args:
+        lat (float): Latitude of the current location.
+        lon (float): Longitude of the current location.
+        k (int): The number of stations to return.
+
+        Returns:
+        list: Up to k station IDs.
+        """
+        if k <= 0 or self._bounds is None:
+            return []
+
+        # The heap holds (-distance, position, station_id), so its root is the
+        # worst station kept so far: the farthest, and the earliest on ties.
+        best = []
+        row, col = self._cell(lat, lon)
+        min_row, max_row, min_col, max_col = self._bounds
+        first_ring = max(0, min_row - row, row - max_row, min_col - col, col - max_col)
+        last_ring = max(row - min_row, max_row - row, col - min_col, max_col - col)
+        min_cos = min(self._min_cos, cos(radians(lat)))
+        # Going round the other way, no station is closer in longitude than
+        # 360 degrees less the largest difference the grid spans.
+        wrap_gap = 360.0 - max(lon - min_col * self.cell_size,
+                               (max_col + 1) * self.cell_size - lon)
+
+        def visit(entries: list) -> None:
+            for position, station in entries:
+                distance = get_lat_lon_distance(lat, lon, station[LAT_INDEX],
+                                                station[LON_INDEX])
+                entry = (-distance, position, station[STATION_ID_INDEX])
+                if len(best) < k:
+                    heappush(best, entry)
+                elif entry > best[0]:
+                    heappushpop(best, entry)
+
+        for ring in range(first_ring, last_ring + 1):
+            if (len(best) == k and ring > 0
+                    and self._ring_bound(ring, min_cos, wrap_gap) > -best[0][0]):
+                break
+            if self._ring_cost(row, col, ring) <= len(self.cells):
+                for entries in self._ring(row, col, ring):
+                    visit(entries)
+                continue
+
+            # The rings left look up more cells than are occupied, so sort
+            # the occupied cells that are left by ring once and go through
+            # them in that order instead.
+            remaining = sorted(
+                ((max(abs(r - row), abs(c - col)), entries)
+                 for (r, c), entries in self.cells.items()
+                 if max(abs(r - row), abs(c - col)) >= ring),
+                key=itemgetter(0))
+            for cell_ring, entries in remaining:
+                if (cell_ring > ring and len(best) == k
+                        and self._ring_bound(cell_ring, min_cos, wrap_gap) > -best[0][0]):
+                    break
+                ring = cell_ring
+                visit(entries)
+            break
+
+        best.sort(reverse=True)
+        return [station_id for _, _, station_id in best]
+
+    def nearest(self, lat: float, lon: float) -> int:
+        """
+        Returns the station ID of the nearest station to the given
+        coordinates, or -1 if the grid is empty. In case of a tie, returns
+        the station ID of the nearest station that appears last in the list.
+
+        Args:
+        lat (float): Latitude of the current location.
+        lon (float): Longitude of the current location.
+
+        Returns:
+        int: The station ID of the nearest station.
+        """
+        found = self.k_nearest(lat, lon, 1)
+        if found:
+            return found[0]
+        return -1
+
+    def in_box(self, min_lat: float, min_lon: float, max_lat: float,
+               max_lon: float) -> list:
+        """
+        Returns the stations whose coordinates lie in the given box, edges
+        included, in list order. A box with min_lon greater than max_lon
+        wraps around the 180th meridian.
+
+        Args:
+        min_lat (float): The southern edge of the box.
+        min_lon (float): The western edge of the box.
+        max_lat (float): The northern edge of the box.
+        max_lon (float): The eastern edge of the box.
+
+        Returns:
+        list: The (position, station) pairs of the stations in the box.
+        """
+        if self._bounds is None or min_lat > max_lat:
+            return []
+        if min_lon > max_lon:
+            found = (self.in_box(min_lat, min_lon, max_lat, 180.0)
+                     + self.in_box(min_lat, -180.0, max_lat, max_lon))
+            found.sort(key=lambda entry: entry[0])
+            return found
+
+        min_row, max_row, min_col, max_col = self._bounds
+        first_row = max(floor(min_lat / self.cell_size), min_row)
+        last_row = min(floor(max_lat / self.cell_size), max_row)
+        first_col = max(floor(min_lon / self.cell_size), min_col)
+        last_col = min(floor(max_lon / self.cell_size), max_col)
+        if first_row > last_row or first_col > last_col:
+            return []
+
+        if (last_row - first_row + 1) * (last_col - first_col + 1) > len(self.cells):
+            cells = [entries for (r, c), entries in self.cells.items()
+                     if first_row <= r <= last_row and first_col <= c <= last_col]
+        else:
+            cells = [self.cells[(r, c)] for r in range(first_row, last_row + 1)
+                     for c in range(first_col, last_col + 1) if (r, c) in self.cells]
+
+        found = [(position, station) for entries in cells
+                 for position, station in entries
+                 if min_lat <= station[LAT_INDEX] <= max_lat
+                 and min_lon <= station[LON_INDEX] <= max_lon]
+        found.sort(key=lambda entry: entry[0])
+        return found
+
+    def within_radius(self, lat: float, lon: float, radius: float) -> list:
+        """
+        Returns the stations within radius kilometers of the given
+        coordinates, nearest first, with ties in list order. Stations are
+        first narrowed down to a bounding box of the circle, and only those
+        are checked with get_lat_lon_distance.
+
+        Args:
+        lat (float): Latitude of the centre.
+        lon (float): Longitude of the centre.
+        radius (float): The radius, in kilometers.
+
+        Returns:
+        list: The (distance, position, station) triples of the stations found.
+        """
+        if radius < 0:
+            return []
+        angle = radius / EARTH_RADIUS
+        margin = 1e-9
+        min_lat = max(-90.0, lat - degrees(angle) - margin)
+        max_lat = min(90.0, lat + degrees(angle) + margin)
+        if min_lat == -90.0 or max_lat == 90.0 or sin(angle) >= cos(radians(lat)):
+            min_lon, max_lon = -180.0, 180.0
+        else:
+            spread = degrees(asin(sin(angle) / cos(radians(lat)))) + margin
+            min_lon = lon - spread
+            max_lon = lon + spread
+            if min_lon < -180.0:
+                min_lon += 360.0
+            if max_lon > 180.0:
+                max_lon -= 360.0
+
+        found = []
+        for position, station in self.in_box(min_lat, min_lon, max_lat, max_lon):
+            distance = get_lat_lon_distance(lat, lon, station[LAT_INDEX], station[LON_INDEX])
+            if distance <= radius:
+                found.append((distance, position, station))
+        found.sort(key=lambda entry: entry[:2])
+        return found
+
+
+def _keep(station: list, with_bikes: bool, with_kiosk: bool) -> bool:
+    """
+    Returns True if station passes the range-query filters.
+    """
+    if with_bikes and station[NUM_BIKES_AVAILABLE_INDEX] <= 0:
+        return False
+    return not with_kiosk or has_kiosk(station)
+
+
+# Function: get_stations_within
+def get_stations_within(lat: float, lon: float, radius: float, grid: StationGrid,
+                        with_bikes: bool = False, with_kiosk: bool = False) -> list:
+    """
+    Returns the station IDs of the stations within radius kilometers of the
+    given coordinates, nearest first.
+
+    Args:
+    lat (float): Latitude of the current location.
+    lon (float): Longitude of the current location.
+    radius (float): The search radius, in kilometers.
+    grid (StationGrid): The spatial index of the stations to search.
+    with_bikes (bool): Whether to keep only stations with bikes available.
+    with_kiosk (bool): Whether to keep only stations with kiosks.
+
+    Returns:
+    list: The matching station IDs.
+    """
+    return [station[STATION_ID_INDEX]
+            for _, _, station in grid.within_radius(lat, lon, radius)
+            if _keep(station, with_bikes, with_kiosk)]
+
+
+# Function: get_stations_in_box
+def get_stations_in_box(min_lat: float, min_lon: float, max_lat: float,
+                        max_lon: float, grid: StationGrid,
+                        with_bikes: bool = False, with_kiosk: bool = False) -> list:
+    """
+    Returns the station IDs of the stations inside a map viewport, in list
+    order.
+
+    Args:
+    min_lat (float): The southern edge of the viewport.
+    min_lon (float): The western edge of the viewport.
+    max_lat (float): The northern edge of the viewport.
+    max_lon (float): The eastern edge of the viewport.
+    grid (StationGrid): The spatial index of the stations to search.
+    with_bikes (bool): Whether to keep only stations with bikes available.
+    with_kiosk (bool): Whether to keep only stations with kiosks.
+
+    Returns:
+    list: The matching station IDs.
+    """
+    return [station[STATION_ID_INDEX]
+            for _, station in grid.in_box(min_lat, min_lon, max_lat, max_lon)
+            if _keep(station, with_bikes, with_kiosk)]
+
+
+# Class: AvailabilityIndex
+class AvailabilityIndex(StationListener):
+    """
+    Spatial indexes of the stations that can currently serve a rental and a
+    return, kept up to date as a StationIndex listener. A station moves in or
+    out of a grid only when its bikes or docks cross zero, so rentals and
+    returns cost O(1) to track in the common case.
+
+    Attributes:
+    rentable (StationGrid): The stations for which can_rent is True.
+    returnable (StationGrid): The stations for which can_return is True.
+    """
+
+    def __init__(self, index: StationIndex,
+                 cell_size: float = DEFAULT_CELL_SIZE) -> None:
+        """
+        Index the stations in index and attach to it.
+
+        Args:
+        index (StationIndex): The stations to index.
+        cell_size (float): The width and height of a grid cell, in degrees.
+        """
+        self.rentable = StationGrid((), cell_size)
+        self.returnable = StationGrid((), cell_size)
+        self._positions = {}
+        self._next_position = 0
+        for station in index:
+            self.station_added(station)
+        index.add_listener(self)
+
+    def _update(self, grid: StationGrid, station: list, available: bool) -> None:
+        station_id = station[STATION_ID_INDEX]
+        listed = station_id in grid
+        if available and not listed:
+            grid.add(station, self._positions[station_id])
+        elif listed and not available:
+            grid.remove(station_id)
+
+    def station_added(self, station: list) -> None:
+        self._positions[station[STATION_ID_INDEX]] = self._next_position
+        self._next_position += 1
+        self._update(self.rentable, station, can_rent(station))
+        self._update(self.returnable, station, can_return(station))
+
+    def station_removed(self, station: list) -> None:
+        station_id = station[STATION_ID_INDEX]
+        self.rentable.remove(station_id)
+        self.returnable.remove(station_id)
+        del self._positions[station_id]
+
+    def station_adjusted(self, station: list, index: int, delta: int) -> None:
+        if index == NUM_BIKES_AVAILABLE_INDEX:
+            self._update(self.rentable, station, can_rent(station))
+        elif index == NUM_DOCKS_AVAILABLE_INDEX:
+            self._update(self.returnable, station, can_return(station))
+
+    def refresh(self, station: list) -> None:
+        """
+        Recheck whether a station can serve rentals and returns, after a
+        change that was not made through the StationIndex, such as a change
+        to its is_renting or is_returning value.
+
+        Args:
+        station (list): A station row in the index.
+        """
+        self._update(self.rentable, station, can_rent(station))
+        self._update(self.returnable, station, can_return(station))
+
+    def nearest_rentable(self, lat: float, lon: float) -> int:
+        """
+        Returns the station ID of the nearest station that can serve a
+        rental, or -1 if there is none. Ties go to the station that appears
+        last in the list, as in get_nearest_station.
+
+        Args:
+        lat (float): Latitude of the current location.
+        lon (float): Longitude of the current location.
+
+        Returns:
+        int: The station ID of the nearest rentable station.
+        """
+        return self.rentable.nearest(lat, lon)
+
+    def nearest_returnable(self, lat: float, lon: float) -> int:
+        """
+        Returns the station ID of the nearest station that can serve a
+        return, or -1 if there is none. Ties go to the station that appears
+        last in the list, as in get_nearest_station.
+
+        Args:
+        lat (float): Latitude of the current location.
+        lon (float): Longitude of the current location.
+
+        Returns:
+        int: The station ID of the nearest returnable station.
+        """
+        return self.returnable.nearest(lat, lon)
@@ -0,0 +1,200 @@
+"""
+An append-only history of station availability.
+
+StationHistory records successive snapshots of a station feed. For each
+station it stores a sample only when the station's bike or dock count
+changes, as the change from the previous sample, in array.array columns.
+Every CHECKPOINT_INTERVAL samples it also stores the full counts, so reading
+the counts at any time decodes at most that many deltas instead of the whole
+history. The network totals of every snapshot are kept separately for
+network-wide queries.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from bike_share import (NUM_BIKES_AVAILABLE_INDEX, NUM_DOCKS_AVAILABLE_INDEX,
+                        STATION_ID_INDEX)
+
+CHECKPOINT_INTERVAL = 64
+SECONDS_PER_MINUTE = 60
+
+
+# Class: _Series
+class _Series:
+    """
+    The delta-encoded samples of one station.
+    """
+
+    def __init__(self) -> None:
+        self.times = array('q')
+        self.bike_deltas = array('i')
+        self.dock_deltas = array('i')
+        self.checkpoint_bikes = array('i')
+        self.checkpoint_docks = array('i')
+        self.bikes = 0
+        self.docks = 0
+
+    def append(self, timestamp: int, bikes: int, docks: int) -> None:
+        if self.times and bikes == self.bikes and docks == self.docks:
+            return
+        if len(self.times) % CHECKPOINT_INTERVAL == 0:
+            self.checkpoint_bikes.append(bikes)
+            self.checkpoint_docks.append(docks)
+        self.times.append(timestamp)
+        self.bike_deltas.append(bikes - self.bikes)
+        self.dock_deltas.append(docks - self.docks)
+        self.bikes = bikes
+        self.docks = docks
+
+    def counts(self, sample: int) -> tuple:
+        """
+        Returns the (bikes, docks) of a sample, decoded from the checkpoint
+        at or before it.
+        """
+        checkpoint = sample // CHECKPOINT_INTERVAL
+        bikes = self.checkpoint_bikes[checkpoint]
+        docks = self.checkpoint_docks[checkpoint]
+        for position in range(checkpoint * CHECKPOINT_INTERVAL + 1, sample + 1):
+            bikes += self.bike_deltas[position]
+            docks += self.dock_deltas[position]
+        return bikes, docks
+
+
+# Class: StationHistory
+class StationHistory:
+    """
+    A history of station feed snapshots, keyed by station ID and timestamp.
+    Timestamps are whole seconds and must not decrease from one snapshot to
+    the next.
+
+    Attributes:
+    times (array): The timestamp of each snapshot.
+    total_bikes (array): The total bikes available in each snapshot.
+    total_docks (array): The total docks available in each snapshot.
+    """
+
+    def __init__(self) -> None:
+        self.times = array('q')
+        self.total_bikes = array('q')
+        self.total_docks = array('q')
+        self._series = {}
+
+    def append(self, timestamp: int, stations) -> None:
+        """
+        Record a snapshot of the given stations taken at timestamp.
+
+        Args:
+        timestamp (int): The time of the snapshot, in seconds.
+        stations (list, StationIndex or StationTable): The stations in the snapshot.
+
+        Raises:
+        ValueError: If timestamp is earlier than the last snapshot.
+        """
+        station_ids, bikes, docks = [], [], []
+        for station in stations:
+            station_ids.append(station[STATION_ID_INDEX])
+            bikes.append(station[NUM_BIKES_AVAILABLE_INDEX])
+            docks.append(station[NUM_DOCKS_AVAILABLE_INDEX])
+        self.append_columns(timestamp, station_ids, bikes, docks)
+
+    def append_columns(self, timestamp: int, station_ids, bikes, docks) -> None:
+        """
+        Record a snapshot given column by column, such as the columns of a
+        StationTable.
+
+        Args:
+        timestamp (int): The time of the snapshot, in seconds.
+        station_ids (sequence): The station IDs in the snapshot.
+        bikes (sequence): The number of bikes available at each station.
+        docks (sequence): The number of docks available at each station.
+
+        Raises:
+        ValueError: If timestamp is earlier than the last snapshot.
+        """
+        if self.times and timestamp < self.times[-1]:
+            raise ValueError(f'snapshot at {timestamp} is older than the last '
+                             f'one at {self.times[-1]}')
+        series_of = self._series
+        for station_id, station_bikes, station_docks in zip(station_ids, bikes, docks):
+            series = series_of.get(station_id)
+            if series is None:
+                series = series_of[station_id] = _Series()
+            series.append(timestamp, station_bikes, station_docks)
+        total_bikes = sum(bikes)
+        total_docks = sum(docks)
+        self.times.append(timestamp)
+        self.total_bikes.append(total_bikes)
+        self.total_docks.append(total_docks)
+
+    def counts_at(self, station_id: int, timestamp: int) -> tuple:
+        """
+        Returns the (bikes, docks) of a station as of the last snapshot at or
+        before timestamp, or None if there is none.
+
+        Args:
+        station_id (int): The station ID.
+        timestamp (int): The time to look up, in seconds.
+
+        Returns:
+        tuple: (number of bikes available, number of docks available), or None.
+        """
+        series = self._series.get(station_id)
+        if series is None:
+            return None
+        sample = bisect_right(series.times, timestamp) - 1
+        if sample < 0:
+            return None
+        return series.counts(sample)
+
+    def bikes_between(self, station_id: int, start: int, end: int) -> list:
+        """
+        Returns the bike counts of a station from start to end, inclusive, as
+        a list of (timestamp, bikes) pairs: the count in effect at start, if
+        any, followed by each change up to end.
+
+        Args:
+        station_id (int): The station ID.
+        start (int): The start of the range, in seconds.
+        end (int): The end of the range, in seconds.
+
+        Returns:
+        list: The (timestamp, bikes) pairs.
+        """
+        series = self._series.get(station_id)
+        if series is None or end < start:
+            return []
+        first = max(bisect_right(series.times, start) - 1, 0)
+        last = bisect_right(series.times, end)
+        if first >= last:
+            return []
+
+        bikes = series.counts(first)[0]
+        found = [(max(series.times[first], start), bikes)]
+        for sample in range(first + 1, last):
+            bikes += series.bike_deltas[sample]
+            found.append((series.times[sample], bikes))
+        return found
+
+    def network_totals_per_minute(self, start: int, end: int) -> list:
+        """
+        Returns the network's total bikes and docks for each minute from
+        start to end that has a snapshot, taken from the last snapshot in
+        that minute.
+
+        Args:
+        start (int): The start of the range, in seconds.
+        end (int): The end of the range, in seconds.
+
+        Returns:
+        list: (minute start, total bikes, total docks) triples, in time order.
+        """
+        found = []
+        snapshot = bisect_right(self.times, end) - 1
+        first = bisect_left(self.times, start)
+        while snapshot >= first:
+            minute = self.times[snapshot] - self.times[snapshot] % SECONDS_PER_MINUTE
+            found.append((minute, self.total_bikes[snapshot], self.total_docks[snapshot]))
+            snapshot = bisect_left(self.times, minute, first, snapshot) - 1
+        found.reverse()
+        return found
@@ -0,0 +1,92 @@
+"""
+Streaming, typed loader for station files in the stations.csv format.
+
+Unlike convert_data, which guesses the type of every cell after the whole
+file has been read, the loader converts each column with the converter
+declared for it in a schema and yields one typed row at a time. Station
+names are interned, so repeated snapshots of a feed share one copy of each
+name.
+"""
+
+import csv
+from sys import intern
+
+from bike_share import parse_flag
+
+# The columns of stations.csv, in the order the loader yields them. The
+# positions match the row-layout constants in bike_share.
+STATION_SCHEMA = [
+    ('station_id', int),
+    ('name', intern),
+    ('capacity', int),
+    ('num_bikes_available', int),
+    ('num_docks_available', int),
+    ('lat', float),
+    ('lon', float),
+    ('is_renting', parse_flag),
+    ('is_returning', parse_flag),
+]
+
+# Function: iter_stations
+def iter_stations(lines, schema: list = STATION_SCHEMA):
+    """
+    Yield one typed row per data line of a CSV file whose first line is a
+    header. Each row holds the schema's columns in schema order, converted
+    with the schema's converters, whatever order the columns have in the
+    file.
+
+    Args:
+    lines (iterable): The lines of the file, for example an open file.
+    schema (list): A list of (column name, converter) pairs.
+
+    Yields:
+    list: A typed station row.
+
+    Raises:
+    ValueError: If the header is missing a column named in the schema, or
+        a line is too short or has a value its converter rejects. The
+        message gives the line number.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    positions = []
+    for column, _ in schema:
+        if column not in header:
+            raise ValueError(f'missing column {column!r} in header {header}')
+        positions.append(header.index(column))
+    columns = [(position, converter) for position, (_, converter)
+               in zip(positions, schema)]
+    width = max(positions, default=-1) + 1
+
+    for line in reader:
+        if not line:
+            continue
+        if len(line) < width:
+            raise ValueError(f'line {reader.line_num}: expected {width} fields, '
+                             f'found {len(line)}')
+        try:
+            row = [converter(line[position]) for position, converter in columns]
+        except ValueError as error:
+            raise ValueError(f'line {reader.line_num}: {error}') from error
+        yield row
+
+# Function: load_stations
+def load_stations(path: str, schema: list = STATION_SCHEMA):
+    """
+    Yield the typed station rows of the CSV file at path, reading the file
+    as the rows are consumed.
+
+    Args:
+    path (str): The path of a file in the stations.csv format.
+    schema (list): A list of (column name, converter) pairs.
+
+    Yields:
+    list: A typed station row.
+
+    Raises:
+    ValueError: If the file does not match the schema, as for iter_stations.
+    """
+    with open(path, newline='') as station_file:
+        yield from iter_stations(station_file, schema)
@@ -0,0 +1,276 @@
+"""
+An asyncio service for station status queries and rentals.
+
+StationService keeps one in-memory station index and spatial grid. It
+watches a station feed file in the stations.csv format, parses new versions
+of it in a worker thread and applies the changes in small slices, so
+queries keep being answered while a feed is reloaded. Requests arrive over
+a local TCP socket as one JSON object per line, for example
+
+    {"op": "info", "station_id": 7000}
+    {"op": "nearest", "lat": 43.66, "lon": -79.39}
+    {"op": "rent", "station_id": 7000}
+    {"op": "return", "station_id": 7000}
+
+and each gets one JSON object per line in reply.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+
+from bike_share import (LAT_INDEX, LON_INDEX, STATION_ID_INDEX, StationIndex,
+                        get_station_info, rent_bike, return_bike)
+from feed_merge import apply_changes, changed_fields
+from spatial_index import StationGrid
+from station_loader import load_stations
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8108
+DEFAULT_POLL_INTERVAL = 5.0  # Seconds between checks of the feed file
+APPLY_SLICE = 500  # Rows applied between yields to the event loop
+# Errors that make watch_feed skip a feed version and keep the current stations.
+FEED_ERRORS = (OSError, ValueError, csv.Error)
+
+logger = logging.getLogger(__name__)
+
+
+def _coordinate(value, limit: float) -> float:
+    """
+    Returns a latitude or longitude from a request as a float, raising
+    ValueError unless it is a number from -limit to limit. NaN and the
+    infinities, which json.loads accepts, fail the range check.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'expected a number, got {value!r}')
+    if not -limit <= value <= limit:
+        raise ValueError(f'coordinate {value!r} out of range')
+    return float(value)
+
+
+# Class: StationService
+class StationService:
+    """
+    Station queries, rentals and feed ingestion on one asyncio event loop.
+
+    Every request handler runs to completion without awaiting, so requests
+    and feed updates never see a half-updated station, and no locks are
+    needed.
+
+    Attributes:
+    stations (StationIndex): The current stations, indexed by ID.
+    grid (StationGrid): A spatial index over the same station rows.
+    """
+
+    def __init__(self, stations=()) -> None:
+        """
+        Start the service with the given station rows.
+
+        Args:
+        stations (list): A list of lists representing multiple stations.
+        """
+        self.stations = StationIndex(list(stations))
+        self.grid = StationGrid(self.stations)
+        self._feed_signature = None
+
+    # Requests
+
+    def get_station_info(self, station_id: int) -> list:
+        return get_station_info(station_id, self.stations)
+
+    def get_nearest_station(self, lat: float, lon: float) -> int:
+        return self.grid.nearest(lat, lon)
+
+    def rent_bike(self, station_id: int) -> bool:
+        return rent_bike(station_id, self.stations)
+
+    def return_bike(self, station_id: int) -> bool:
+        return return_bike(station_id, self.stations)
+
+    def handle(self, request: dict) -> dict:
+        """
+        Returns the reply to one decoded request.
+
+        Args:
+        request (dict): The request, with an 'op' key and its arguments.
+
+        Returns:
+        dict: {'result': ...} on success or {'error': message} on failure.
+        """
+        if not isinstance(request, dict):
+            return {'error': 'bad request: expected a JSON object'}
+        op = request.get('op')
+        try:
+            if op == 'info':
+                result = self.get_station_info(request['station_id'])
+            elif op == 'nearest':
+                result = self.get_nearest_station(_coordinate(request['lat'], 90.0),
+                                                  _coordinate(request['lon'], 180.0))
+            elif op == 'rent':
+                result = self.rent_bike(request['station_id'])
+            elif op == 'return':
+                result = self.return_bike(request['station_id'])
+            else:
+                return {'error': f'unknown op {op!r}'}
+        except (KeyError, TypeError, ValueError) as error:
+            return {'error': f'bad request: {error}'}
+        return {'result': result}
+
+    async def handle_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        """
+        Answer the requests of one client connection until it closes.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = self.handle(json.loads(line))
+                except json.JSONDecodeError as error:
+                    reply = {'error': f'bad request: {error}'}
+                writer.write(json.dumps(reply).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        """
+        Serve requests on a local TCP socket until cancelled.
+
+        Args:
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+        """
+        server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+    # Feed ingestion
+
+    async def apply_feed(self, rows: list) -> tuple:
+        """
+        Bring the stations in line with a new feed snapshot, changing only
+        the rows that differ, as merge_feed does. Stations missing from the
+        snapshot are removed. Every row is checked before any is applied, so
+        a bad snapshot leaves the stations as they were. The event loop gets
+        a turn after every APPLY_SLICE rows checked, rows applied and
+        removals.
+
+        Args:
+        rows (list): The typed station rows of the new snapshot.
+
+        Returns:
+        tuple: The numbers of (added, removed, changed) stations.
+
+        Raises:
+        ValueError: If a row's latitude or longitude is not a finite number
+            in range. No row is applied.
+        """
+        for count, row in enumerate(rows, 1):
+            try:
+                _coordinate(row[LAT_INDEX], 90.0)
+                _coordinate(row[LON_INDEX], 180.0)
+            except ValueError as error:
+                raise ValueError(f'station {row[STATION_ID_INDEX]}: {error}') from error
+            if count % APPLY_SLICE == 0:
+                await asyncio.sleep(0)
+
+        added = changed = 0
+        seen = set()
+        for count, row in enumerate(rows, 1):
+            station_id = row[STATION_ID_INDEX]
+            seen.add(station_id)
+            station = self.stations.find(station_id)
+            if station is None:
+                self.stations.add(row)
+                self.grid.add(row)
+                added += 1
+            else:
+                fields = changed_fields(station, row)
+                if fields:
+                    if apply_changes(self.stations, station, row, fields) is not station:
+                        self.grid.remove(station_id)
+                        self.grid.add(self.stations.find(station_id))
+                    changed += 1
+            if count % APPLY_SLICE == 0:
+                await asyncio.sleep(0)
+
+        removed = [station_id for station_id in self.stations.by_id
+                   if station_id not in seen]
+        for count, station_id in enumerate(removed, 1):
+            self.stations.remove(station_id)
+            self.grid.remove(station_id)
+            if count % APPLY_SLICE == 0:
+                await asyncio.sleep(0)
+        return added, len(removed), changed
+
+    async def reload_feed(self, path: str) -> tuple:
+        """
+        Parse the feed file at path in a worker thread and apply it.
+
+        Args:
+        path (str): The path of a file in the stations.csv format.
+
+        Returns:
+        tuple: The numbers of (added, removed, changed) stations.
+        """
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(None, lambda: list(load_stations(path)))
+        return await self.apply_feed(rows)
+
+    async def watch_feed(self, path: str,
+                         interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        """
+        Reload the feed file at path whenever it changes, checking every
+        interval seconds, until cancelled. A new version is only loaded
+        once its modification time and size are the same at two checks in
+        a row, so a feed that is still being written is not read. A version
+        that cannot be read or parsed is logged and skipped, and the current
+        stations are kept until the file changes again.
+
+        Args:
+        path (str): The path of a file in the stations.csv format.
+        interval (float): The number of seconds between checks.
+        """
+        pending = None
+        while True:
+            try:
+                status = os.stat(path)
+                signature = (status.st_mtime_ns, status.st_size)
+            except FileNotFoundError:
+                signature = None
+            if signature is None or signature == self._feed_signature:
+                pending = None
+            elif signature != pending:
+                pending = signature
+            else:
+                self._feed_signature = signature
+                try:
+                    await self.reload_feed(path)
+                except FEED_ERRORS as error:
+                    logger.warning('skipping feed %s: %r', path, error)
+            await asyncio.sleep(interval)
+
+
+async def _main(feed_path: str, host: str, port: int, interval: float) -> None:
+    service = StationService()
+    await asyncio.gather(service.watch_feed(feed_path, interval),
+                         service.serve(host, port))
+
+
+if __name__ == '__main__':
+    from instrumentation import enable_from_environment
+
+    enable_from_environment()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('feed', help='station feed file in the stations.csv format')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--interval', type=float, default=DEFAULT_POLL_INTERVAL)
+    args = parser.parse_args()
+    asyncio.run(_main(args.feed, args.host, args.port, args.interval))
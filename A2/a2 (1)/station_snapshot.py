@@ -0,0 +1,267 @@
+"""
+A compact binary snapshot format for station tables.
+
+A snapshot file holds a fixed header, then one fixed-width column per numeric
+station field, then a table of name offsets and a heap of UTF-8 encoded
+names. Each section starts on an 8-byte boundary. open_snapshot maps the file
+with mmap and reads the columns in place, so processes that open the same
+snapshot share its pages instead of each parsing stations.csv.
+"""
+
+import csv
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from bike_share import NO_KIOSK, STATION_ID_INDEX
+from station_loader import STATION_SCHEMA, load_stations
+from station_table import COLUMN_TYPECODES, StationTable
+
+MAGIC = b'BSNP'
+VERSION = 1
+
+# magic, version, byte order (0 little, 1 big), number of stations,
+# size of the name heap in bytes.
+_HEADER = struct.Struct('<4sHHQQ')
+_BYTE_ORDER = 0 if sys.byteorder == 'little' else 1
+_ALIGNMENT = 8
+
+
+def _padding(size: int) -> bytes:
+    """
+    Returns the zero bytes needed after a section of the given size to reach
+    the next 8-byte boundary.
+    """
+    return bytes(-size % _ALIGNMENT)
+
+
+def _snapshot_size(count: int, heap_size: int) -> int:
+    """
+    Returns the size in bytes of a snapshot file holding count stations
+    whose names take heap_size bytes.
+    """
+    size = _HEADER.size + len(_padding(_HEADER.size))
+    for typecode in COLUMN_TYPECODES.values():
+        column_size = count * array(typecode).itemsize
+        size += column_size + len(_padding(column_size))
+    return size + (count + 1) * array('q').itemsize + heap_size
+
+
+# Class: _NameHeap
+class _NameHeap:
+    """
+    A read-only sequence of the station names in a snapshot, decoded from the
+    name heap as they are read.
+    """
+
+    def __init__(self, offsets: memoryview, heap: memoryview) -> None:
+        self.offsets = offsets
+        self.heap = heap
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> str:
+        start = self.offsets[position]
+        end = self.offsets[position + 1]
+        return sys.intern(str(self.heap[start:end], 'utf-8'))
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+
+# Class: SnapshotTable
+class SnapshotTable(StationTable):
+    """
+    A read-only StationTable whose columns are memoryviews of a mapped
+    snapshot file. Use to_table for a writable copy.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Map the snapshot file at path.
+
+        Args:
+        path (str): The path of a snapshot file.
+
+        Raises:
+        ValueError: If the file is not a snapshot this code can read, or is
+            truncated or corrupt.
+        """
+        with open(path, 'rb') as snapshot_file:
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        if len(self._view) < _HEADER.size:
+            self.close()
+            raise ValueError(f'{path} is too short to be a station snapshot')
+        magic, version, byte_order, count, heap_size = _HEADER.unpack_from(self._view)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a version {VERSION} station snapshot')
+        if byte_order != _BYTE_ORDER:
+            self.close()
+            raise ValueError(f'{path} was written with a different byte order')
+        size = len(self._view)
+        if size != _snapshot_size(count, heap_size):
+            self.close()
+            raise ValueError(f'{path} is truncated or corrupt: it holds {size} '
+                             f'bytes, but its header describes '
+                             f'{_snapshot_size(count, heap_size)}')
+
+        offset = _HEADER.size + len(_padding(_HEADER.size))
+        self.columns = {}
+        for index, typecode in COLUMN_TYPECODES.items():
+            size = count * array(typecode).itemsize
+            self.columns[index] = self._view[offset:offset + size].cast(typecode)
+            offset += size + len(_padding(size))
+
+        size = (count + 1) * array('q').itemsize
+        offsets = self._view[offset:offset + size].cast('q')
+        offset += size
+        if offsets[0] != 0 or offsets[count] != heap_size:
+            offsets.release()
+            self.close()
+            raise ValueError(f'{path} is corrupt: its name offsets do not match '
+                             f'its name heap')
+        self.names = _NameHeap(offsets, self._view[offset:offset + heap_size])
+
+        self.positions = {}
+        for position, station_id in enumerate(self.columns[STATION_ID_INDEX]):
+            self.positions.setdefault(station_id, position)
+        self._kiosks = None
+
+    @property
+    def kiosks(self) -> bytearray:
+        """
+        The kiosk column, worked out from the names the first time it is
+        needed rather than when the snapshot is opened.
+        """
+        if self._kiosks is None:
+            self._kiosks = bytearray(NO_KIOSK not in name for name in self.names)
+        return self._kiosks
+
+    def __enter__(self) -> 'SnapshotTable':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Release the views of the snapshot and unmap the file.
+        """
+        for column in getattr(self, 'columns', {}).values():
+            column.release()
+        names = getattr(self, 'names', None)
+        if names is not None:
+            names.offsets.release()
+            names.heap.release()
+        self._view.release()
+        self._map.close()
+
+    def append(self, station: list) -> None:
+        raise TypeError('a station snapshot is read-only; use to_table() first')
+
+    def to_table(self) -> StationTable:
+        """
+        Returns a writable StationTable holding a copy of the snapshot.
+
+        Returns:
+        StationTable: The copied table.
+        """
+        table = StationTable()
+        for index, column in self.columns.items():
+            table.columns[index].frombytes(column.cast('B'))
+        table.names = list(self.names)
+        table.kiosks = bytearray(self.kiosks)
+        table.positions = dict(self.positions)
+        return table
+
+
+# Function: write_snapshot
+def write_snapshot(path: str, stations) -> None:
+    """
+    Write the given stations to a snapshot file at path. The file is written
+    next to path and then renamed into place, so readers never see a partly
+    written snapshot.
+
+    Args:
+    path (str): The path of the snapshot file to write.
+    stations (list or StationTable): The stations to write. Rows from
+        convert_data, whose flags are 'TRUE'/'FALSE' strings, are accepted.
+    """
+    if not isinstance(stations, StationTable):
+        stations = StationTable(stations)
+
+    offsets = array('q', [0])
+    heap = bytearray()
+    for name in stations.names:
+        heap += name.encode('utf-8')
+        offsets.append(len(heap))
+
+    temp_path = f'{path}.tmp{os.getpid()}'
+    with open(temp_path, 'wb') as snapshot_file:
+        header = _HEADER.pack(MAGIC, VERSION, _BYTE_ORDER, len(stations), len(heap))
+        snapshot_file.write(header + _padding(len(header)))
+        for index in COLUMN_TYPECODES:
+            data = stations.columns[index].tobytes()
+            snapshot_file.write(data + _padding(len(data)))
+        snapshot_file.write(offsets.tobytes())
+        snapshot_file.write(heap)
+    os.replace(temp_path, path)
+
+
+# Function: open_snapshot
+def open_snapshot(path: str) -> SnapshotTable:
+    """
+    Returns a read-only station table backed by the snapshot file at path.
+
+    Args:
+    path (str): The path of a snapshot file.
+
+    Returns:
+    SnapshotTable: The mapped table.
+    """
+    return SnapshotTable(path)
+
+
+# Function: csv_to_snapshot
+def csv_to_snapshot(csv_path: str, snapshot_path: str) -> None:
+    """
+    Convert a file in the stations.csv format into a snapshot file.
+
+    Args:
+    csv_path (str): The path of the CSV file to read.
+    snapshot_path (str): The path of the snapshot file to write.
+    """
+    write_snapshot(snapshot_path, StationTable(load_stations(csv_path)))
+
+
+# Function: snapshot_to_csv
+def snapshot_to_csv(snapshot_path: str, csv_path: str) -> None:
+    """
+    Convert a snapshot file into a file in the stations.csv format.
+
+    Args:
+    snapshot_path (str): The path of the snapshot file to read.
+    csv_path (str): The path of the CSV file to write.
+    """
+    with open_snapshot(snapshot_path) as table, \
+            open(csv_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([column for column, _ in STATION_SCHEMA])
+        for row in table:
+            writer.writerow([_csv_value(value) for value in row.to_list()])
+
+
+def _csv_value(value) -> str:
+    """
+    Returns value formatted the way stations.csv writes it.
+    """
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    return str(value)
@@ -0,0 +1,268 @@
+"""
+A columnar station table.
+
+StationTable keeps each numeric station field in its own array.array column
+and the station names in a list of interned strings, instead of keeping one
+Python list of boxed values per station. Whether each station has a kiosk is
+worked out once, when its name is stored, and kept in a boolean column, so
+kiosk queries select from the ID column with itertools.compress instead of
+searching names. Rows are read and written through
+StationRow views, which support the same indexing as a station list, so the
+bike_share functions accept a StationTable wherever they accept a list of
+stations.
+"""
+
+from array import array
+from collections.abc import Sequence
+from itertools import compress
+from sys import intern
+
+from bike_share import (CAPACITY_INDEX, IS_RENTING_INDEX, IS_RETURNING_INDEX,
+                        LAT_INDEX, LON_INDEX, NAME_INDEX, NO_KIOSK,
+                        NUM_BIKES_AVAILABLE_INDEX, NUM_DOCKS_AVAILABLE_INDEX,
+                        STATION_ID_INDEX, parse_flag, station_flag)
+
+# The array.array type code of each numeric column, keyed by its row index.
+COLUMN_TYPECODES = {
+    STATION_ID_INDEX: 'q',
+    CAPACITY_INDEX: 'q',
+    NUM_BIKES_AVAILABLE_INDEX: 'q',
+    NUM_DOCKS_AVAILABLE_INDEX: 'q',
+    LAT_INDEX: 'd',
+    LON_INDEX: 'd',
+    IS_RENTING_INDEX: 'b',
+    IS_RETURNING_INDEX: 'b',
+}
+
+# The number of fields in a full station row.
+ROW_LENGTH = IS_RETURNING_INDEX + 1
+
+# Fields that are stored as 0/1 in their column but read back as bools.
+_FLAG_INDEXES = (IS_RENTING_INDEX, IS_RETURNING_INDEX)
+
+
+# Class: StationRow
+class StationRow:
+    """
+    A view of one row of a StationTable.
+
+    Indexing a StationRow with a bike_share row-layout constant reads or
+    writes the matching column of the table, and iterating over it or
+    comparing it with a list goes through the fields in row order, so a
+    StationRow can be used wherever a station list is expected.
+
+    Attributes:
+    table (StationTable): The table the row belongs to.
+    position (int): The position of the row in the table.
+    """
+
+    __slots__ = ('table', 'position')
+
+    def __init__(self, table: 'StationTable', position: int) -> None:
+        self.table = table
+        self.position = position
+
+    def __getitem__(self, index: int):
+        if isinstance(index, slice):
+            return self.to_list()[index]
+        if not -ROW_LENGTH <= index < ROW_LENGTH:
+            raise IndexError('station row index out of range')
+        index %= ROW_LENGTH
+        if index == NAME_INDEX:
+            return self.table.names[self.position]
+        value = self.table.columns[index][self.position]
+        if index in _FLAG_INDEXES:
+            return bool(value)
+        return value
+
+    def __setitem__(self, index: int, value) -> None:
+        if not -ROW_LENGTH <= index < ROW_LENGTH:
+            raise IndexError('station row assignment index out of range')
+        index %= ROW_LENGTH
+        if index == NAME_INDEX:
+            self.table.names[self.position] = intern(value)
+            self.table.kiosks[self.position] = NO_KIOSK not in value
+        elif index in _FLAG_INDEXES:
+            self.table.columns[index][self.position] = parse_flag(value)
+        else:
+            self.table.columns[index][self.position] = value
+
+    def __len__(self) -> int:
+        return ROW_LENGTH
+
+    def __iter__(self):
+        for index in range(ROW_LENGTH):
+            yield self[index]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (Sequence, StationRow)) or isinstance(other, str):
+            return NotImplemented
+        return self.to_list() == list(other)
+
+    def __repr__(self) -> str:
+        return f'StationRow({self.to_list()})'
+
+    def has_kiosk(self) -> bool:
+        """
+        Returns True if the station has a kiosk, read from the table's kiosk
+        column.
+        """
+        return bool(self.table.kiosks[self.position])
+
+    def to_list(self) -> list:
+        """
+        Returns the row as a station list.
+
+        Returns:
+        list: [station_id, name, capacity, num_bikes_available,
+            num_docks_available, lat, lon, is_renting, is_returning].
+        """
+        return [self[index] for index in range(ROW_LENGTH)]
+
+
+# Class: StationTable
+class StationTable:
+    """
+    A table of stations stored column by column.
+
+    Station rows with only seven fields are treated as renting and
+    returning, and flags given as the 'TRUE'/'FALSE' strings left by
+    convert_data are stored as bools (see bike_share.station_flag).
+
+    Attributes:
+    columns (dict): A mapping from row index to the array.array column
+        holding that field.
+    names (list): The interned station names.
+    kiosks (bytearray): 1 at each position whose station has a kiosk, 0
+        elsewhere.
+    positions (dict): A mapping from station ID to row position.
+    """
+
+    def __init__(self, stations=()) -> None:
+        """
+        Build the table from the given station rows.
+
+        Args:
+        stations (list): A list of lists representing multiple stations.
+        """
+        self.columns = {index: array(typecode)
+                        for index, typecode in COLUMN_TYPECODES.items()}
+        self.names = []
+        self.kiosks = bytearray()
+        self.positions = {}
+        for station in stations:
+            self.append(station)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self):
+        for position in range(len(self.names)):
+            yield StationRow(self, position)
+
+    def __getitem__(self, position: int) -> StationRow:
+        if not -len(self.names) <= position < len(self.names):
+            raise IndexError('station table index out of range')
+        return StationRow(self, position % len(self.names))
+
+    def append(self, station: list) -> None:
+        """
+        Add a station row to the end of the table.
+
+        Args:
+        station (list): A list representing a station.
+        """
+        for index, column in self.columns.items():
+            if index in _FLAG_INDEXES:
+                column.append(station_flag(station, index))
+            else:
+                column.append(station[index])
+        self.names.append(intern(station[NAME_INDEX]))
+        self.kiosks.append(NO_KIOSK not in station[NAME_INDEX])
+        self.positions.setdefault(station[STATION_ID_INDEX], len(self.names) - 1)
+
+    def extend_columns(self, columns: dict, names: list) -> None:
+        """
+        Add rows to the end of the table given column by column, as parsed
+        in bulk. Each numeric column is copied in one step.
+
+        Args:
+        columns (dict): A mapping from row index to an array.array holding
+            that field for the new rows, with the type code in COLUMN_TYPECODES.
+        names (list): The names of the new rows.
+        """
+        start = len(self.names)
+        for index, column in self.columns.items():
+            column.extend(columns[index])
+        self.names.extend(intern(name) for name in names)
+        self.kiosks.extend(NO_KIOSK not in name for name in names)
+        for position, station_id in enumerate(columns[STATION_ID_INDEX], start):
+            self.positions.setdefault(station_id, position)
+
+    def find(self, station_id: int) -> StationRow:
+        """
+        Returns the row of the station with the given ID, or None if there is
+        no such station.
+
+        Args:
+        station_id (int): The station ID to search for.
+
+        Returns:
+        StationRow: The station row, or None.
+        """
+        position = self.positions.get(station_id)
+        if position is None:
+            return None
+        return StationRow(self, position)
+
+    def column_sum(self, index: int) -> int:
+        """
+        Returns the sum of the column at the given row index.
+
+        Args:
+        index (int): The index of the column to sum.
+
+        Returns:
+        int: The sum of the values in the column.
+        """
+        return sum(self.columns[index])
+
+    def kiosk_ids(self) -> list:
+        """
+        Returns a list of the IDs of the stations that have kiosks, in table
+        order.
+
+        Returns:
+        list: A list of station IDs that have kiosks.
+        """
+        return list(compress(self.columns[STATION_ID_INDEX], self.kiosks))
+
+    def upgrade(self, capacity_threshold: int, bikes_to_add: int) -> int:
+        """
+        Add bikes_to_add bikes, each with a new dock, to every station with
+        capacity less than capacity_threshold.
+
+        Args:
+        capacity_threshold (int): The capacity below which stations are upgraded.
+        bikes_to_add (int): The number of bikes (and docks) to add to each qualifying station.
+
+        Returns:
+        int: The total number of bikes added.
+        """
+        capacity = self.columns[CAPACITY_INDEX]
+        bikes = self.columns[NUM_BIKES_AVAILABLE_INDEX]
+        qualifying = [position for position, value in enumerate(capacity)
+                      if value < capacity_threshold]
+        for position in qualifying:
+            bikes[position] += bikes_to_add
+            capacity[position] += bikes_to_add
+        return len(qualifying) * bikes_to_add
+
+    def to_stations(self) -> list:
+        """
+        Returns the table as a list of station lists.
+
+        Returns:
+        list: A list of lists representing multiple stations.
+        """
+        return [row.to_list() for row in self]
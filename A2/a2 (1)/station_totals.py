@@ -0,0 +1,115 @@
+"""
+Running totals over a StationIndex.
+
+StationTotals listens to a StationIndex and keeps the sum of each numeric
+column and the set of stations with kiosks up to date as stations are added,
+removed and adjusted, so dashboards can read them in constant time instead of
+summing over every station on each request.
+"""
+
+from bike_share import (CAPACITY_INDEX, NUM_BIKES_AVAILABLE_INDEX,
+                        NUM_DOCKS_AVAILABLE_INDEX, STATION_ID_INDEX,
+                        StationIndex, StationListener, has_kiosk)
+
+# The columns whose totals are kept unless others are asked for.
+DEFAULT_TOTAL_COLUMNS = (CAPACITY_INDEX, NUM_BIKES_AVAILABLE_INDEX,
+                         NUM_DOCKS_AVAILABLE_INDEX)
+
+
+# Class: StationTotals
+class StationTotals(StationListener):
+    """
+    Column totals and kiosk stations, maintained as a StationIndex listener.
+
+    Attributes:
+    totals (dict): A mapping from row index to the sum of that column.
+    kiosks (dict): The IDs of the stations with kiosks, as keys in station
+        order.
+    """
+
+    def __init__(self, index: StationIndex,
+                 columns: tuple = DEFAULT_TOTAL_COLUMNS) -> None:
+        """
+        Compute the totals for the stations in index and attach to it.
+
+        Args:
+        index (StationIndex): The stations to total.
+        columns (tuple): The row indexes of the columns to total.
+        """
+        self.totals = dict.fromkeys(columns, 0)
+        self.kiosks = {}
+        for station in index:
+            self.station_added(station)
+        index.add_listener(self)
+
+    def station_added(self, station: list) -> None:
+        for index in self.totals:
+            self.totals[index] += station[index]
+        if has_kiosk(station):
+            self.kiosks[station[STATION_ID_INDEX]] = None
+
+    def station_removed(self, station: list) -> None:
+        for index in self.totals:
+            self.totals[index] -= station[index]
+        self.kiosks.pop(station[STATION_ID_INDEX], None)
+
+    def station_adjusted(self, station: list, index: int, delta: int) -> None:
+        if index in self.totals:
+            self.totals[index] += delta
+
+    def stations_adjusted(self, stations: list, index: int, delta: int) -> None:
+        if index in self.totals:
+            self.totals[index] += delta * len(stations)
+
+
+# Class: TotalsStationIndex
+class TotalsStationIndex(StationIndex):
+    """
+    A StationIndex that keeps running column totals and its kiosk stations,
+    so get_column_sum and get_stations_with_kiosks do not scan the stations.
+
+    Values must be changed through rent_bike, return_bike, upgrade_stations,
+    apply_transactions or adjust_station for the totals to stay correct. The
+    totals are shared by all stations, so callers that change stations from
+    several threads must serialise those changes themselves, for example
+    through a ConcurrentInventory.
+
+    Attributes:
+    totals (StationTotals): The maintained totals.
+    """
+
+    def __init__(self, stations: list,
+                 columns: tuple = DEFAULT_TOTAL_COLUMNS) -> None:
+        """
+        Build the index and its totals from the given station rows.
+
+        Args:
+        stations (list): A list of lists representing multiple stations.
+        columns (tuple): The row indexes of the columns to total.
+        """
+        super().__init__(stations)
+        self.totals = StationTotals(self, columns)
+
+    def column_sum(self, index: int) -> int:
+        """
+        Returns the sum of the column at the given row index, in constant
+        time if the column is totalled.
+
+        Args:
+        index (int): The index of the column to sum.
+
+        Returns:
+        int: The sum of the values in the column.
+        """
+        if index in self.totals.totals:
+            return self.totals.totals[index]
+        return sum(station[index] for station in self)
+
+    def kiosk_ids(self) -> list:
+        """
+        Returns a list of the IDs of the stations that have kiosks.
+
+        Returns:
+        list: A list of station IDs that have kiosks.
+        """
+        return list(self.totals.kiosks)
@@ -0,0 +1,604 @@
+"""Behavioural checks for the modules built around bike_share.py."""
+
+import ast
+import asyncio
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import bike_share
+from capacity_index import CapacityStationIndex
+from change_log import ChangeLog, read_log, replay
+from feed_merge import diff_feed, merge_feed
+from fleet_simulation import simulate_city_day
+import instrumentation
+from inventory import ConcurrentInventory
+from parallel_ingest import ingest_history, ingest_table
+from rebalancing import evaluate_plans
+from sharded_store import write_shards
+import station_service
+from spatial_index import AvailabilityIndex, StationGrid
+from station_history import StationHistory
+from station_loader import iter_stations, load_stations
+from station_service import StationService
+from station_snapshot import (csv_to_snapshot, open_snapshot, snapshot_to_csv,
+                              write_snapshot)
+from station_table import StationTable
+from station_totals import TotalsStationIndex
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STATIONS_CSV = os.path.join(HERE, 'stations.csv')
+
+
+def _converted_stations() -> list:
+    """Return the rows of stations.csv as convert_data leaves them."""
+    with open(STATIONS_CSV, newline='') as csv_file:
+        rows = list(csv.reader(csv_file))[1:]
+    bike_share.convert_data(rows)
+    return rows
+
+
+def _loaded_stations() -> list:
+    """Return the rows of stations.csv as station_loader types them."""
+    return list(load_stations(STATIONS_CSV))
+
+
+class TestStationIndex:
+    """StationIndex against the same changes made to a plain list."""
+
+    def test_remove_matches_list(self) -> None:
+        rng = random.Random(108)
+        for _ in range(100):
+            shared = [[rng.randrange(20), 'Station', position]
+                      for position in range(rng.randrange(1, 30))]
+            expected = [list(station) for station in shared]
+            index = bike_share.StationIndex(shared)
+            for step in range(40):
+                station_id = rng.randrange(20)
+                if rng.random() < 0.3:
+                    index.add([station_id, 'Station', 100 + step])
+                    expected.append([station_id, 'Station', 100 + step])
+                    continue
+                found = next((station for station in expected
+                              if station[0] == station_id), None)
+                if found is not None:
+                    expected.remove(found)
+                assert index.remove(station_id) == found
+                assert shared == expected
+                assert list(index) == expected
+                assert len(index) == len(expected)
+                assert index.find(station_id) == next(
+                    (station for station in expected if station[0] == station_id),
+                    None)
+
+    def test_remove_many_matches_remove(self) -> None:
+        rng = random.Random(1)
+        for _ in range(100):
+            rows = [[rng.randrange(20), 'Station', position]
+                    for position in range(rng.randrange(1, 30))]
+            one_by_one = bike_share.StationIndex([list(row) for row in rows])
+            index = bike_share.StationIndex((list(row) for row in rows))
+            index.remove(rows[0][0])
+            one_by_one.remove(rows[0][0])
+            station_ids = [rng.randrange(20) for _ in range(rng.randrange(10))]
+            expected = [one_by_one.remove(station_id) for station_id in station_ids]
+            assert index.remove_many(station_ids) == \
+                [station for station in expected if station is not None]
+            assert index.rows == one_by_one.rows
+            assert [index.find(station_id) for station_id in range(20)] == \
+                [one_by_one.find(station_id) for station_id in range(20)]
+
+    def test_shared_list_stays_usable(self) -> None:
+        stations = _converted_stations()
+        station_id = stations[1][bike_share.STATION_ID_INDEX]
+        bike_share.StationIndex(stations).remove(station_id)
+        assert station_id not in [station[0] for station in stations]
+        assert bike_share.get_nearest_station(43.65, -79.38, stations) != station_id
+        assert bike_share.get_column_sum(bike_share.CAPACITY_INDEX, stations) > 0
+        assert station_id not in bike_share.get_stations_with_kiosks(stations)
+
+
+class TestLoader:
+    """iter_stations on malformed lines."""
+
+    HEADER = ('station_id,name,capacity,num_bikes_available,num_docks_available,'
+              'lat,lon,is_renting,is_returning')
+
+    def test_short_line(self) -> None:
+        lines = [self.HEADER, '7000,Station,10,5,5,43.6,-79.4,TRUE,TRUE',
+                 '7001,Station,10,5']
+        with pytest.raises(ValueError, match='line 3'):
+            list(iter_stations(lines))
+
+    def test_bad_flag(self) -> None:
+        lines = [self.HEADER, '7000,Station,10,5,5,43.6,-79.4,TRUE,maybe']
+        with pytest.raises(ValueError, match='line 2'):
+            list(iter_stations(lines))
+
+    def test_flags_in_any_case(self) -> None:
+        lines = [self.HEADER, '7000,Station,10,5,5,43.6,-79.4,true,False']
+        assert list(iter_stations(lines)) == \
+            [[7000, 'Station', 10, 5, 5, 43.6, -79.4, True, False]]
+
+
+class _AdjustmentCounter(bike_share.StationListener):
+    """Counts adjustments with a read-modify-write that yields the GIL."""
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def station_adjusted(self, station: list, index: int, delta: int) -> None:
+        count = self.count
+        time.sleep(0)
+        self.count = count + 1
+
+
+class TestConcurrentInventory:
+    """ConcurrentInventory from many threads over an index with listeners."""
+
+    def test_listeners_stay_consistent(self) -> None:
+        stations = _loaded_stations()[:40]
+        index = TotalsStationIndex(stations)
+        availability = AvailabilityIndex(index)
+        log = ChangeLog(index)
+        counter = _AdjustmentCounter()
+        index.add_listener(counter)
+        inventory = ConcurrentInventory(index, num_stripes=8)
+        ids = [station[bike_share.STATION_ID_INDEX] for station in stations]
+        successes = []
+
+        def work(seed: int) -> None:
+            rng = random.Random(seed)
+            done = 0
+            for _ in range(500):
+                station_id = rng.choice(ids)
+                choice = rng.random()
+                if choice < 0.45:
+                    done += inventory.rent(station_id)
+                elif choice < 0.9:
+                    done += inventory.return_(station_id)
+                else:
+                    bikes = inventory.get_info(station_id)[1]
+                    done += inventory.compare_and_set(station_id, bikes, bikes // 2)
+            successes.append(done)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=work, args=(seed,)) for seed in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        for column, total in index.totals.totals.items():
+            assert total == sum(station[column] for station in stations)
+        for station in stations:
+            station_id = station[bike_share.STATION_ID_INDEX]
+            assert (station_id in availability.rentable) == bike_share.can_rent(station)
+            assert (station_id in availability.returnable) == \
+                bike_share.can_return(station)
+        events = log.drain()
+        assert [event[0] for event in events] == list(range(2 * sum(successes)))
+        assert counter.count == len(events)
+
+
+class TestTransactions:
+    """apply_transactions against rent_bike and return_bike one by one."""
+
+    def test_matches_sequential_calls(self) -> None:
+        rng = random.Random(8)
+        for use_index in (False, True):
+            stations = _converted_stations()
+            for station in rng.sample(stations, 50):
+                station[rng.choice((bike_share.IS_RENTING_INDEX,
+                                    bike_share.IS_RETURNING_INDEX))] = 'FALSE'
+            expected = [list(station) for station in stations]
+            ids = [station[0] for station in stations[:40]] + [-1]
+            events = [(rng.choice((bike_share.RENT, bike_share.RETURN)), rng.choice(ids))
+                      for _ in range(3000)]
+            sequential = [bike_share.rent_bike(station_id, expected)
+                          if operation == bike_share.RENT
+                          else bike_share.return_bike(station_id, expected)
+                          for operation, station_id in events]
+            target = bike_share.StationIndex(stations) if use_index else stations
+            results, counters = bike_share.apply_transactions(events, target)
+            assert results == sequential
+            assert stations == expected
+            assert counters['failed'] == sequential.count(False)
+
+    def test_closed_station_string_flags(self) -> None:
+        stations = _converted_stations()
+        stations[0][bike_share.IS_RENTING_INDEX] = 'FALSE'
+        stations[0][bike_share.IS_RETURNING_INDEX] = 'false'
+        station_id = stations[0][bike_share.STATION_ID_INDEX]
+        assert not bike_share.rent_bike(station_id, stations)
+        assert not bike_share.return_bike(station_id, stations)
+        assert bike_share.apply_transactions(
+            [(bike_share.RENT, station_id), (bike_share.RETURN, station_id)],
+            stations)[0] == [False, False]
+
+
+class TestFeedMerge:
+    """diff_feed and merge_feed on rows from both loaders."""
+
+    def test_converted_and_loaded_rows_agree(self) -> None:
+        assert diff_feed(_converted_stations(), _loaded_stations()) == \
+            {'added': [], 'removed': [], 'changed': {}}
+
+    def test_merge_reaches_new_feed(self) -> None:
+        stations = _converted_stations()
+        rows = _loaded_stations()[10:]
+        rows[0][bike_share.NUM_BIKES_AVAILABLE_INDEX] += 1
+        rows[1][bike_share.IS_RENTING_INDEX] = False
+        rows.append([1, 'New Station', 10, 5, 5, 43.65, -79.38, True, True])
+        summary = merge_feed(stations, rows)
+        assert len(summary['removed']) == 10
+        assert summary['added'] == [1]
+        assert sorted(summary['changed']) == sorted([rows[0][0], rows[1][0]])
+        assert None not in stations
+        assert sorted(station[0] for station in stations) == sorted(row[0] for row in rows)
+        assert diff_feed(stations, rows) == {'added': [], 'removed': [], 'changed': {}}
+
+
+class TestChangeLog:
+    """A logged sequence of changes replayed onto the original stations."""
+
+    def test_file_round_trip(self, tmp_path) -> None:
+        path = str(tmp_path / 'changes.log')
+        rng = random.Random(20)
+        original = _loaded_stations()
+        index = CapacityStationIndex([list(station) for station in original])
+        log = ChangeLog(index, capacity=16, path=path)
+        ids = [station[0] for station in original]
+        for _ in range(500):
+            bike_share.rent_bike(rng.choice(ids), index)
+            bike_share.return_bike(rng.choice(ids), index)
+        bike_share.upgrade_stations(15, 2, index)
+        index.remove(ids[0])
+        index.add([1, 'New Station', 10, 5, 5, 43.65, -79.38, True, True])
+        log.close()
+
+        events = list(read_log(path))
+        assert [event[0] for event in events] == list(range(len(events)))
+        assert log.dropped == len(events) - 16
+        copy = bike_share.StationIndex([list(station) for station in original])
+        assert replay(events, copy) == len(events)
+        assert list(copy) == list(index)
+
+    def test_torn_tail_dropped_on_reopen(self, tmp_path) -> None:
+        path = tmp_path / 'changes.log'
+        index = bike_share.StationIndex(_loaded_stations())
+        log = ChangeLog(index, path=str(path))
+        index.remove(7000)
+        log.flush()
+        first_size = path.stat().st_size
+        index.add([1, 'New Station', 10, 5, 5, 43.65, -79.38, True, True])
+        log.close()
+        data = path.read_bytes()
+        complete = list(read_log(str(path)))
+        for size in range(first_size, len(data)):
+            path.write_bytes(data[:size])
+            assert list(read_log(str(path))) == complete[:1]
+            log = ChangeLog(index, path=str(path))
+            index.adjust(index.find(7001), bike_share.CAPACITY_INDEX, 1)
+            log.close()
+            index.listeners.remove(log)
+            assert list(read_log(str(path))) == \
+                complete[:1] + [(1, 7001, bike_share.CAPACITY_INDEX, 1)]
+
+
+class TestParallelIngest:
+    """Parallel parsing against station_loader."""
+
+    def test_table_matches_serial_load(self, tmp_path) -> None:
+        second = tmp_path / 'second.csv'
+        with open(STATIONS_CSV) as csv_file:
+            second.write_text(csv_file.read())
+        paths = [STATIONS_CSV, str(second)]
+        expected = _loaded_stations() * 2
+        for max_workers in (0, 2):
+            table = ingest_table(paths, max_workers=max_workers, chunk_size=4096)
+            assert table.to_stations() == expected
+
+    def test_history_matches_serial_append(self, tmp_path) -> None:
+        stations = _loaded_stations()
+        snapshots = []
+        expected = StationHistory()
+        for number in range(3):
+            for station in stations[number::7]:
+                station[bike_share.NUM_BIKES_AVAILABLE_INDEX] += 1
+            path = tmp_path / f'snapshot{number}.csv'
+            with open(path, 'w', newline='') as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(['station_id', 'name', 'capacity', 'num_bikes_available',
+                                 'num_docks_available', 'lat', 'lon', 'is_renting',
+                                 'is_returning'])
+                writer.writerows([str(value).upper() if isinstance(value, bool) else value
+                                  for value in station] for station in stations)
+            snapshots.append((60 * number, str(path)))
+            expected.append(60 * number, stations)
+        history = ingest_history(snapshots, max_workers=0, chunk_size=4096)
+        assert list(history.times) == list(expected.times)
+        assert list(history.total_bikes) == list(expected.total_bikes)
+        for station in stations[:20]:
+            station_id = station[bike_share.STATION_ID_INDEX]
+            assert history.bikes_between(station_id, 0, 120) == \
+                expected.bikes_between(station_id, 0, 120)
+
+
+class TestCapacityIndex:
+    """CapacityStationIndex upgrades against upgrade_stations on a list."""
+
+    def test_upgrades_match_list(self) -> None:
+        rng = random.Random(11)
+        for _ in range(100):
+            stations = [[rng.randrange(30), 'Station', rng.randrange(1, 40),
+                         rng.randrange(10), 5, 43.6, -79.4]
+                        for _ in range(rng.randrange(40))]
+            expected = [list(station) for station in stations]
+            index = CapacityStationIndex(stations)
+            upgrades = [(rng.randrange(50), rng.randrange(-2, 8))
+                        for _ in range(rng.randrange(1, 6))]
+            total = sum(bike_share.upgrade_stations(threshold, bikes, expected)
+                        for threshold, bikes in upgrades)
+            assert index.upgrade_many(upgrades) == total
+            assert list(index) == expected
+            for threshold in range(0, 60, 5):
+                assert sorted(station[0] for station in index.capacity.below(threshold)) \
+                    == sorted(station[0] for station in expected
+                              if station[bike_share.CAPACITY_INDEX] < threshold)
+
+    def test_rows_sharing_an_id(self) -> None:
+        stations = [[1, 'Station', 5, 2, 3, 43.6, -79.4],
+                    [1, 'Station', 5, 2, 3, 43.6, -79.4]]
+        expected = [list(station) for station in stations]
+        assert bike_share.upgrade_stations(10, 2, CapacityStationIndex(stations)) == \
+            bike_share.upgrade_stations(10, 2, expected) == 4
+        assert stations == expected
+
+
+class TestStationGrid:
+    """StationGrid queries against get_nearest_station."""
+
+    def test_nearest_matches_linear_scan(self) -> None:
+        rng = random.Random(2)
+        for spread in ('city', 'world', 'antimeridian'):
+            for _ in range(20):
+                stations = []
+                for station_id in range(rng.randrange(1, 50)):
+                    if spread == 'city':
+                        lat, lon = 43.6 + rng.random() / 10, -79.5 + rng.random() / 10
+                    elif spread == 'world':
+                        lat, lon = rng.uniform(-89, 89), rng.uniform(-180, 180)
+                    else:
+                        lat = rng.uniform(-60, 60)
+                        lon = rng.choice((rng.uniform(170, 180), rng.uniform(-180, -170)))
+                    # Rounding makes ties between stations likely.
+                    stations.append([station_id, 'Station', 1, 1, 1,
+                                     round(lat, 2), round(lon, 2)])
+                grid = StationGrid(stations)
+                for _ in range(10):
+                    lat, lon = rng.uniform(-89, 89), rng.uniform(-180, 180)
+                    assert grid.nearest(lat, lon) == \
+                        bike_share.get_nearest_station(lat, lon, stations)
+                for station in stations:
+                    lat, lon = station[bike_share.LAT_INDEX], station[bike_share.LON_INDEX]
+                    assert grid.nearest(lat, lon) == \
+                        bike_share.get_nearest_station(lat, lon, stations)
+
+    def test_cities_far_apart(self) -> None:
+        rng = random.Random(3)
+        stations = _loaded_stations() + [
+            [100000 + number, 'Sydney', 1, 1, 1, -33.9 + rng.random() / 10,
+             151.2 + rng.random() / 10] for number in range(200)]
+        grid = StationGrid(stations)
+        for lat, lon in ((43.65, -79.4), (-33.85, 151.25), (0.0, 0.0),
+                         (-50.0, 170.0), (10.0, -150.0)):
+            assert grid.nearest(lat, lon) == \
+                bike_share.get_nearest_station(lat, lon, stations)
+
+
+class TestStationTable:
+    """StationRow as a station list, and StationTable as a list of them."""
+
+    def test_row_behaves_as_list(self) -> None:
+        stations = _loaded_stations()
+        row = StationTable(stations)[3]
+        assert list(row) == stations[3]
+        assert row == stations[3] and row == StationTable(stations)[3]
+        assert row != None and row != stations[4]
+        assert row[-1] == stations[3][-1]
+        with pytest.raises(IndexError):
+            row[bike_share.IS_RETURNING_INDEX + 1]
+
+    def test_table_input(self, tmp_path) -> None:
+        stations = _loaded_stations()
+        table = StationTable(stations)
+        def shard_key(station):
+            return station[bike_share.STATION_ID_INDEX] % 3
+        by_list = write_shards(stations, str(tmp_path / 'list'), shard_key)
+        by_table = write_shards(table, str(tmp_path / 'table'), shard_key)
+        assert [shard.count for shard in by_table.shards] == \
+            [shard.count for shard in by_list.shards]
+        candidates = [{'num_trucks': 2, 'truck_capacity': 20}]
+        assert evaluate_plans(table, candidates, max_workers=0) == \
+            evaluate_plans(stations, candidates, max_workers=0)
+        simulated = simulate_city_day(table, num_regions=2, trips_per_day=500,
+                                      duration=3600, max_workers=0)
+        expected = simulate_city_day(stations, num_regions=2, trips_per_day=500,
+                                     duration=3600, max_workers=0)
+        assert simulated['stations'] == expected['stations']
+
+
+class TestSnapshot:
+    """Round trips through StationTable and snapshot files."""
+
+    def test_table_accepts_string_flags(self) -> None:
+        stations = _converted_stations()
+        stations[0][bike_share.IS_RENTING_INDEX] = 'FALSE'
+        table = StationTable(stations)
+        assert table[0][bike_share.IS_RENTING_INDEX] is False
+        assert table[1][bike_share.IS_RENTING_INDEX] is True
+
+    def test_table_rejects_unknown_flag(self) -> None:
+        stations = _converted_stations()
+        stations[0][bike_share.IS_RETURNING_INDEX] = 'MAYBE'
+        with pytest.raises(ValueError):
+            StationTable(stations)
+
+    def test_converted_rows_round_trip(self, tmp_path) -> None:
+        path = str(tmp_path / 'stations.snap')
+        write_snapshot(path, _converted_stations())
+        with open_snapshot(path) as table:
+            assert table.to_table().to_stations() == _loaded_stations()
+
+    def test_damaged_file_rejected(self, tmp_path) -> None:
+        path = tmp_path / 'stations.snap'
+        csv_to_snapshot(STATIONS_CSV, str(path))
+        data = path.read_bytes()
+        for size in (10, 32, len(data) - 8, len(data) - 3):
+            path.write_bytes(data[:size])
+            with pytest.raises(ValueError):
+                open_snapshot(str(path))
+        heap_size = int.from_bytes(data[16:24], 'little')
+        end_offset = len(data) - heap_size - 8
+        path.write_bytes(data[:end_offset] + (heap_size - 1).to_bytes(8, sys.byteorder)
+                         + data[end_offset + 8:])
+        with pytest.raises(ValueError):
+            open_snapshot(str(path))
+
+    def test_csv_round_trip(self, tmp_path) -> None:
+        snapshot_path = str(tmp_path / 'stations.snap')
+        csv_path = str(tmp_path / 'stations.csv')
+        csv_to_snapshot(STATIONS_CSV, snapshot_path)
+        snapshot_to_csv(snapshot_path, csv_path)
+        assert list(load_stations(csv_path)) == _loaded_stations()
+
+
+class TestStationService:
+    """Feed ingestion and requests of StationService."""
+
+    def test_bad_feed_keeps_stations(self, tmp_path) -> None:
+        feed = tmp_path / 'feed.csv'
+        with open(STATIONS_CSV) as csv_file:
+            text = csv_file.read()
+
+        async def watch() -> tuple:
+            service = StationService()
+            feed.write_text(text)
+            task = asyncio.create_task(service.watch_feed(str(feed), 0.01))
+            await asyncio.sleep(0.1)
+            loaded = len(service.stations)
+            feed.write_text(text[:len(text) // 2].rsplit(',', 3)[0] + '\n')
+            await asyncio.sleep(0.1)
+            alive = not task.done()
+            task.cancel()
+            return loaded, len(service.stations), alive
+
+        loaded, after, alive = asyncio.run(watch())
+        assert loaded == after == len(_loaded_stations())
+        assert alive
+
+    def test_bad_row_leaves_stations_unchanged(self) -> None:
+        service = StationService(_loaded_stations())
+        rows = _loaded_stations()[5:]
+        rows[0][bike_share.NUM_BIKES_AVAILABLE_INDEX] += 1
+        rows[-1][bike_share.LAT_INDEX] = float('nan')
+        with pytest.raises(ValueError):
+            asyncio.run(service.apply_feed(rows))
+        assert list(service.stations) == _loaded_stations()
+        rows[-1][bike_share.LAT_INDEX] = 43.65
+        assert asyncio.run(service.apply_feed(rows)) == (0, 5, 2)
+        assert list(service.stations) == rows
+
+    def test_bad_coordinates_get_error_replies(self) -> None:
+        service = StationService(_loaded_stations())
+        for line in ('{"op": "nearest", "lat": NaN, "lon": -79.4}',
+                     '{"op": "nearest", "lat": 43.6, "lon": Infinity}',
+                     '{"op": "nearest", "lat": 1e400, "lon": -79.4}',
+                     '{"op": "nearest", "lat": 43.6, "lon": 10' + '0' * 400 + '}',
+                     '{"op": "nearest", "lat": "43.6", "lon": -79.4}',
+                     '{"op": "nearest", "lat": true, "lon": -79.4}'):
+            assert 'error' in service.handle(json.loads(line))
+        reply = service.handle({'op': 'nearest', 'lat': 43.66, 'lon': -79.39})
+        assert reply == {'result': bike_share.get_nearest_station(
+            43.66, -79.39, _loaded_stations())}
+
+
+class TestFleetSimulation:
+    """simulate_city_day delivers every cross-region trip on time."""
+
+    @staticmethod
+    def _run(exchange_interval: int, max_workers: int) -> tuple:
+        result = simulate_city_day(_loaded_stations(), 3, 50000, duration=3600,
+                                   exchange_interval=exchange_interval, seed=2,
+                                   max_workers=max_workers)
+        totals = dict(result['totals'])
+        del totals['seconds']
+        return totals, result['stations']
+
+    def test_exchange_interval_does_not_change_outcome(self) -> None:
+        # Arrivals are never clamped to the end of an epoch, so how often
+        # regions exchange trips must not matter.
+        expected = self._run(60, 0)
+        assert expected[0]['outbound'] > 0
+        assert self._run(7, 0) == expected
+        assert self._run(60, 2) == expected
+
+    def test_long_exchange_interval_rejected(self) -> None:
+        with pytest.raises(ValueError):
+            simulate_city_day(_loaded_stations(), exchange_interval=900)
+
+
+class TestInstrumentation:
+    """Turning instrumentation on and off, in code and from the environment."""
+
+    def test_enable_patches_imported_copies(self) -> None:
+        instrumentation.enable(['rent_bike'])
+        try:
+            assert station_service.rent_bike is bike_share.rent_bike
+            assert station_service.rent_bike.__wrapped__ is not None
+            calls = instrumentation.snapshot()['rent_bike']['calls']
+            StationService(_loaded_stations()).rent_bike(7000)
+            assert instrumentation.snapshot()['rent_bike']['calls'] == calls + 1
+        finally:
+            instrumentation.disable()
+        assert not hasattr(station_service.rent_bike, '__wrapped__')
+
+    def test_launcher(self, tmp_path) -> None:
+        dump_path = tmp_path / 'calls.json'
+        script = tmp_path / 'rent.py'
+        script.write_text('from station_service import StationService\n'
+                          'from station_loader import load_stations\n'
+                          f'stations = load_stations({STATIONS_CSV!r})\n'
+                          'StationService(stations).rent_bike(7000)\n')
+        environment = dict(os.environ, BIKE_SHARE_INSTRUMENT=str(dump_path))
+        subprocess.run([sys.executable, 'instrumentation.py', str(script)], cwd=HERE,
+                       env=environment, check=True)
+        dumps = [name for name in os.listdir(tmp_path) if name.endswith('.json')]
+        assert len(dumps) == 1 and dumps[0].startswith('calls.')
+        assert sorted(os.listdir(tmp_path)) == sorted(dumps + ['rent.py'])
+        assert instrumentation.merge_dumps(str(dump_path))['rent_bike']['calls'] == 1
+
+    def test_worker_processes_dump_separately(self, tmp_path) -> None:
+        dump_path = tmp_path / 'calls.json'
+        environment = dict(os.environ, BIKE_SHARE_INSTRUMENT=str(dump_path))
+        output = subprocess.run([sys.executable, 'fleet_simulation.py', STATIONS_CSV,
+                                 '--regions', '2', '--trips', '2000', '--workers', '2'],
+                                cwd=HERE, env=environment, check=True,
+                                capture_output=True, text=True).stdout
+        totals = ast.literal_eval(output.rsplit('totals:', 1)[1])
+        assert len(os.listdir(tmp_path)) == 3
+        merged = instrumentation.merge_dumps(str(dump_path))
+        assert merged['rent_bike']['calls'] == \
+            totals['departures'] + totals['failed_rentals']
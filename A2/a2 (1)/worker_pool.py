@@ -0,0 +1,82 @@
+"""
+Process pools whose workers share data that is set up once per worker.
+
+Data that every task needs, such as the stations being planned for, is sent
+to each worker process once, by the pool's initializer, rather than with
+every task, and tasks read it back with worker_state. With max_workers set
+to 0 the data is installed in this process and the tasks run here, which
+keeps them easy to debug and profile. Each worker also starts
+instrumentation when BIKE_SHARE_INSTRUMENT is set (see instrumentation.py).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import enable_from_environment
+
+# Filled in each worker by init_worker.
+_STATE = {}
+
+
+# Function: init_worker
+def init_worker(state: dict) -> None:
+    """
+    Replace the worker state of this process, and start instrumentation if
+    BIKE_SHARE_INSTRUMENT is set. Used as the pool initializer.
+
+    Args:
+    state (dict): The data the tasks share.
+    """
+    _STATE.clear()
+    _STATE.update(state)
+    enable_from_environment()
+
+
+# Function: worker_state
+def worker_state() -> dict:
+    """
+    Returns the worker state installed in this process by init_worker.
+
+    Returns:
+    dict: The data the tasks share.
+    """
+    return _STATE
+
+
+# Function: start_workers
+def start_workers(max_workers: int, state: dict):
+    """
+    Returns a ProcessPoolExecutor whose workers start with the given state,
+    or None, after installing the state in this process, if max_workers is 0.
+
+    Args:
+    max_workers (int): The number of worker processes, 0 to run tasks in
+        this process, or None for one per CPU.
+    state (dict): The data the tasks share.
+
+    Returns:
+    ProcessPoolExecutor: The executor, or None.
+    """
+    if max_workers == 0:
+        init_worker(state)
+        return None
+    return ProcessPoolExecutor(max_workers, initializer=init_worker,
+                               initargs=(state,))
+
+
+# Function: map_tasks
+def map_tasks(executor, function, tasks):
+    """
+    Returns an iterator over function applied to each task, in task order,
+    on the executor from start_workers, or in this process if it is None.
+
+    Args:
+    executor (ProcessPoolExecutor): The executor, or None.
+    function (callable): A module-level function taking one task.
+    tasks (iterable): The tasks.
+
+    Returns:
+    iterator: The results.
+    """
+    if executor is None:
+        return map(function, tasks)
+    return executor.map(function, tasks)